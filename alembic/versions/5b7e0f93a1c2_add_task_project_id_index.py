@@ -0,0 +1,29 @@
+"""add task project id index
+
+Revision ID: 5b7e0f93a1c2
+Revises: c41e2a9d7f10
+Create Date: 2026-10-17 11:40:05.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e0f93a1c2'
+down_revision: Union[str, None] = 'c41e2a9d7f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Serves the capped `?include=tasks` embed, which reads the first N tasks of each project by id.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tasks_project_id_id', 'tasks', ['project_id', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tasks_project_id_id', table_name='tasks', postgresql_concurrently=True)
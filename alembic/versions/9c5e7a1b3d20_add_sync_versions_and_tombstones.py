@@ -0,0 +1,85 @@
+"""add sync versions and tombstones
+
+Revision ID: 9c5e7a1b3d20
+Revises: f3b91d6e2c47
+Create Date: 2026-10-17 18:40:52.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c5e7a1b3d20'
+down_revision: Union[str, None] = 'f3b91d6e2c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CHANGE_VERSION = "pg_current_xact_id()::text::bigint"
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION stamp_change_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := {CHANGE_VERSION};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO sync_tombstones (entity, entity_id, project_id)
+            VALUES (TG_ARGV[0], OLD.id, coalesce((to_jsonb(OLD) ->> 'project_id')::integer, OLD.id));
+            RETURN OLD;
+        END $$ LANGUAGE plpgsql
+    """)
+    op.create_table('sync_tombstones',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('entity', sa.String(length=16), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default=sa.text(CHANGE_VERSION), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_tombstones_version_id', 'sync_tombstones', ['version', 'id'], unique=False)
+
+    # A volatile default on ADD COLUMN would rewrite the table under an exclusive lock, so the column starts
+    # out nullable, new rows get the default and the triggers, and existing rows are backfilled in batches.
+    for table, entity in (('projects', 'project'), ('tasks', 'task')):
+        op.add_column(table, sa.Column('version', sa.BigInteger(), nullable=True))
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN version SET DEFAULT ({CHANGE_VERSION})")
+        op.execute(f"CREATE TRIGGER {table}_stamp_version BEFORE UPDATE ON {table} FOR EACH ROW EXECUTE FUNCTION stamp_change_version()")
+        op.execute(f"CREATE TRIGGER {table}_tombstone AFTER DELETE ON {table} FOR EACH ROW EXECUTE FUNCTION record_tombstone('{entity}')")
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for table in ('projects', 'tasks'):
+            # The update trigger stamps each batch with its own transaction's id.
+            statement = sa.text(f"""
+                UPDATE {table} SET version = {CHANGE_VERSION}
+                WHERE id IN (SELECT id FROM {table} WHERE version IS NULL LIMIT {BACKFILL_BATCH_SIZE})
+            """)
+            while connection.execute(statement).rowcount:
+                pass
+        for table in ('projects', 'tasks'):
+            op.create_index(f'ix_{table}_version_id', table, ['version', 'id'], unique=False, postgresql_concurrently=True)
+
+    op.alter_column('projects', 'version', nullable=False)
+    op.alter_column('tasks', 'version', nullable=False)
+
+
+def downgrade() -> None:
+    for table in ('tasks', 'projects'):
+        op.execute(f"DROP TRIGGER {table}_tombstone ON {table}")
+        op.execute(f"DROP TRIGGER {table}_stamp_version ON {table}")
+        op.drop_index(f'ix_{table}_version_id', table_name=table)
+        op.drop_column(table, 'version')
+    op.drop_index('ix_sync_tombstones_version_id', table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    op.execute("DROP FUNCTION record_tombstone()")
+    op.execute("DROP FUNCTION stamp_change_version()")
@@ -0,0 +1,43 @@
+"""add task stats summary
+
+Revision ID: a7d2c9e41f08
+Revises: e8a4c1d05b39
+Create Date: 2026-10-17 15:12:37.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2c9e41f08'
+down_revision: Union[str, None] = 'e8a4c1d05b39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('task_stats',
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('task_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('completed_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('project_id', 'owner_id')
+    )
+    op.create_index('ix_task_stats_owner_id', 'task_stats', ['owner_id'], unique=False)
+    # Backfill; writes made between this and enabling TASK_STATS_SUMMARY need `python -m scripts.rebuild_task_stats`.
+    op.execute("""
+        INSERT INTO task_stats (project_id, owner_id, task_count, completed_count)
+        SELECT project_id, owner_id, count(*), count(*) FILTER (WHERE completed)
+        FROM tasks
+        GROUP BY project_id, owner_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_task_stats_owner_id', table_name='task_stats')
+    op.drop_table('task_stats')
@@ -0,0 +1,26 @@
+"""add jobs claim token
+
+Revision ID: b71d3f8e2a64
+Revises: 4e2a7c9b1f35
+Create Date: 2026-10-17 23:41:09.265117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71d3f8e2a64'
+down_revision: Union[str, None] = '4e2a7c9b1f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('claim_token', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'claim_token')
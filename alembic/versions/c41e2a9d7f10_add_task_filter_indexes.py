@@ -0,0 +1,37 @@
+"""add task filter indexes
+
+Revision ID: c41e2a9d7f10
+Revises: b3f30f508cc8
+Create Date: 2026-10-17 09:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e2a9d7f10'
+down_revision: Union[str, None] = 'b3f30f508cc8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY cannot run inside a transaction, and keeps writes flowing on large tables.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tasks_project_id_completed_id', 'tasks', ['project_id', 'completed', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_tasks_owner_id_id', 'tasks', ['owner_id', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_tasks_title_id', 'tasks', ['title', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_tasks_open_project_id_id', 'tasks', ['project_id', 'id'], unique=False, postgresql_concurrently=True, postgresql_where=sa.text('completed = false'))
+        op.create_index('ix_projects_owner_id_id', 'projects', ['owner_id', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_projects_owner_id_id', table_name='projects', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_open_project_id_id', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_title_id', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_owner_id_id', table_name='tasks', postgresql_concurrently=True)
+        op.drop_index('ix_tasks_project_id_completed_id', table_name='tasks', postgresql_concurrently=True)
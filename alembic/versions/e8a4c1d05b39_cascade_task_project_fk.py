@@ -0,0 +1,29 @@
+"""cascade task project fk
+
+Revision ID: e8a4c1d05b39
+Revises: 5b7e0f93a1c2
+Create Date: 2026-10-17 13:05:51.640388
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a4c1d05b39'
+down_revision: Union[str, None] = '5b7e0f93a1c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # b3f30f508cc8 recreated this key without ON DELETE CASCADE; project deletes rely on it again.
+    op.drop_constraint('tasks_project_id_fkey', 'tasks', type_='foreignkey')
+    op.create_foreign_key('tasks_project_id_fkey', 'tasks', 'projects', ['project_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    op.drop_constraint('tasks_project_id_fkey', 'tasks', type_='foreignkey')
+    op.create_foreign_key('tasks_project_id_fkey', 'tasks', 'projects', ['project_id'], ['id'])
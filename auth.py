@@ -1,10 +1,14 @@
+import asyncio
+import hashlib
 import os
+import time
+import concurrent.futures
 
 from dotenv import load_dotenv
 
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from datetime import timedelta
+
+from lru import TTLCache
 
 load_dotenv()
 
@@ -14,40 +18,236 @@ ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Asymmetric algorithms (RS*, ES*, PS*) sign with PEM private keys and verify with the public halves.
+# Access and refresh tokens must use different key pairs, like the two HMAC secrets.
+JWT_PRIVATE_KEY_PATH = os.getenv("JWT_PRIVATE_KEY_PATH")
+JWT_PUBLIC_KEY_PATH = os.getenv("JWT_PUBLIC_KEY_PATH")
+JWT_REFRESH_PRIVATE_KEY_PATH = os.getenv("JWT_REFRESH_PRIVATE_KEY_PATH")
+JWT_REFRESH_PUBLIC_KEY_PATH = os.getenv("JWT_REFRESH_PUBLIC_KEY_PATH")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Authenticated principal cache
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+# Trust the `uid` claim of access tokens and skip the user lookup entirely on protected routes.
+TRUST_TOKEN_CLAIMS = os.getenv("TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# Password hashing pool
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread")
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "32"))
+
+# python-jose, passlib and cryptography are imported on first use, not with this module,
+# which keeps them off the import path of scripts and short-lived processes that never touch them.
+_pwd_context = None
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        # Pinning min and max rounds makes any hash with a different cost factor "need update",
+        # so logins transparently rehash after BCRYPT_ROUNDS changes.
+        _pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS,
+        )
+    return _pwd_context
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PasswordPool:
+    """Runs bcrypt off the event loop and rejects work once `max_queue` calls are waiting."""
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: concurrent.futures.Executor | None = None
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        # concurrent.futures imports the executor modules on first attribute access.
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordPoolBusy("Password hashing pool is saturated")
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def reset_after_fork(self):
+        # The parent's executor threads or processes do not exist in a forked child.
+        self._executor = None
+        self.in_flight = 0
+
+
+password_pool = PasswordPool(PASSWORD_POOL, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE)
+os.register_at_fork(after_in_child=password_pool.reset_after_fork)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await password_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+
+def _read_key(path: str) -> str:
+    with open(path) as key_file:
+        return key_file.read()
+
+
+def load_keys(secret: str, private_key_path: str | None, public_key_path: str | None):
+    from jose import jwk
+
+    # Key objects are built once so jose skips parsing the key material on every sign/verify.
+    if ALGORITHM.startswith(("RS", "ES", "PS")):
+        return jwk.construct(_read_key(private_key_path), ALGORITHM), jwk.construct(_read_key(public_key_path), ALGORITHM)
+    key = jwk.construct(secret, ALGORITHM)
+    return key, key
+
+
+# Loaded on the first sign or verify; see load_signing_keys.
+ACCESS_SIGNING_KEY = ACCESS_VERIFYING_KEY = None
+REFRESH_SIGNING_KEY = REFRESH_VERIFYING_KEY = None
+
+
+def load_signing_keys():
+    global ACCESS_SIGNING_KEY, ACCESS_VERIFYING_KEY, REFRESH_SIGNING_KEY, REFRESH_VERIFYING_KEY
+    if ACCESS_SIGNING_KEY is None or ACCESS_VERIFYING_KEY is None:
+        ACCESS_SIGNING_KEY, ACCESS_VERIFYING_KEY = load_keys(SECRET_KEY, JWT_PRIVATE_KEY_PATH, JWT_PUBLIC_KEY_PATH)
+    if REFRESH_SIGNING_KEY is None or REFRESH_VERIFYING_KEY is None:
+        REFRESH_SIGNING_KEY, REFRESH_VERIFYING_KEY = load_keys(REFRESH_SECRET_KEY, JWT_REFRESH_PRIVATE_KEY_PATH, JWT_REFRESH_PUBLIC_KEY_PATH)
+
+
+def preload():
+    # For servers that fork workers: pay the crypto imports once in the parent instead of on each worker's first login.
+    load_signing_keys()
+    pwd_context()
+
+# Already-verified access tokens, keyed by their SHA-256 and dropped at `exp`.
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Keyed by the token `sub`; entries never outlive the token that populated them.
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def token_ttl(payload: dict) -> float:
+    return payload["exp"] - time.time() if "exp" in payload else PRINCIPAL_CACHE_TTL_SECONDS
+
+
+def _expires_at(expires_delta: timedelta) -> int:
+    return int(time.time() + expires_delta.total_seconds())
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    from jose import jwt
+
+    if ACCESS_SIGNING_KEY is None:
+        load_signing_keys()
+    expire = _expires_at(expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    return jwt.encode({**data, "exp": expire}, ACCESS_SIGNING_KEY, algorithm=ALGORITHM)
 
 
 def create_refresh_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
+    from jose import jwt
+
+    if REFRESH_SIGNING_KEY is None:
+        load_signing_keys()
+    expire = _expires_at(expires_delta if expires_delta else timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    return jwt.encode({**data, "exp": expire}, REFRESH_SIGNING_KEY, algorithm=ALGORITHM)
 
 
 def decode_access_token(token: str):
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return dict(payload)
+
+    from jose import JWTError, jwt
+
+    if ACCESS_VERIFYING_KEY is None:
+        load_signing_keys()
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, ACCESS_VERIFYING_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
+    token_cache.set(cache_key, payload, ttl=token_ttl(payload))
+    return dict(payload)
 
 
 def decode_refresh_token(token: str):
+    from jose import JWTError, jwt
+
+    if REFRESH_VERIFYING_KEY is None:
+        load_signing_keys()
     try:
-        return jwt.decode(token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
+        return jwt.decode(token, REFRESH_VERIFYING_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
+
+
+def client_key(headers, client) -> str:
+    # Identifies "the same client" for read-your-writes and rate limits: the access token's subject, else the
+    # peer address. `headers` is a Starlette Headers, `client` the (host, port) pair of the request or scope.
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = decode_access_token(token)
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}"
+    return f"ip:{client[0] if client else ''}"
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import auth
+
+# Appends one JSON line per HTTP request to this file; replay it with `python -m scripts.replay`.
+CAPTURE_PATH = os.getenv("CAPTURE_PATH", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1"))
+CAPTURE_MAX_BODY = int(os.getenv("CAPTURE_MAX_BODY", "65536"))
+# Requests waiting to be written; while the disk is this far behind, new ones are left out of the capture.
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+
+# Never written to a capture; replay logs users in with its own password instead.
+REDACTED_FIELDS = {"password", "refresh_token"}
+
+
+def _request_body(raw: bytes, content_type: str):
+    if not raw or len(raw) > CAPTURE_MAX_BODY:
+        return None
+    if content_type.startswith("application/json"):
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            return None
+        if isinstance(body, dict):
+            body = {key: value for key, value in body.items() if key not in REDACTED_FIELDS}
+        return {"json": body}
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return {"form": {key: value for key, value in parse_qsl(raw.decode()) if key not in REDACTED_FIELDS}}
+    return None
+
+
+def _path(path: str, query_string: bytes) -> str:
+    if not query_string:
+        return path
+    params = [(key, value) for key, value in parse_qsl(query_string.decode(), keep_blank_values=True) if key not in REDACTED_FIELDS]
+    return path + ("?" + urlencode(params) if params else "")
+
+
+def _user(headers: dict) -> str | None:
+    scheme, _, token = headers.get(b"authorization", b"").decode().partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = auth.decode_access_token(token)
+        if payload:
+            return payload.get("sub")
+    return None
+
+
+def _line(request: dict) -> str:
+    entry = {
+        "t": request["t"],
+        "method": request["method"],
+        "path": _path(request["path"], request["query_string"]),
+        "route": request["route"],
+        "user": request["user"],
+        "status": request["status"],
+        "duration_ms": request["duration_ms"],
+    }
+    body = _request_body(request["body"], request["content_type"])
+    if body is not None:
+        entry.update(body)
+    return json.dumps(entry, separators=(",", ":")) + "\n"
+
+
+class CaptureMiddleware:
+    """Records method, path, body, caller and timing of each request, for load-shape replay."""
+
+    def __init__(self, app, path: str = CAPTURE_PATH, sample_rate: float = CAPTURE_SAMPLE_RATE):
+        self.app = app
+        self.file = open(path, "a")
+        self.sample_rate = sample_rate
+        self.started = time.time()
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue(CAPTURE_QUEUE_SIZE)
+        self.dropped = 0
+        self.writer: asyncio.Task | None = None
+
+    def record(self, request: dict):
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._write_batches())
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _write_batches(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            closing = None in batch
+            # Encoded and written on a thread, so neither holds up requests on the event loop.
+            await asyncio.to_thread(self._write, [request for request in batch if request is not None])
+            if closing:
+                return
+
+    def _write(self, requests: list[dict]):
+        self.file.write("".join(_line(request) for request in requests))
+        self.file.flush()
+
+    async def close(self):
+        # Writes out what is still queued.
+        if self.writer is not None:
+            await self.queue.put(None)
+            await self.writer
+            self.writer = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            async def send_after_closing(message):
+                if message["type"] == "lifespan.shutdown.complete":
+                    await self.close()
+                await send(message)
+            return await self.app(scope, receive, send_after_closing)
+
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            return await self.app(scope, receive, send)
+
+        at = time.time()
+        chunks = []
+        status_code = 500
+
+        async def receive_and_keep():
+            # Keeps the body as the app reads it, so the request is never buffered twice.
+            message = await receive()
+            if message["type"] == "http.request" and sum(map(len, chunks)) <= CAPTURE_MAX_BODY:
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_and_keep(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_keep, send_and_keep)
+        finally:
+            headers = dict(scope["headers"])
+            route = scope.get("route")
+            self.record({
+                "t": round(at - self.started, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope["query_string"],
+                "route": route.path if route is not None else None,
+                # Decoded here: the route has just put the token in auth's cache, which is not thread-safe.
+                "user": _user(headers),
+                "status": status_code,
+                "duration_ms": round((time.time() - at) * 1000, 3),
+                "body": b"".join(chunks),
+                "content_type": headers.get(b"content-type", b"").decode(),
+            })
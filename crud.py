@@ -1,20 +1,147 @@
+import os
+
+from sqlalchemy import Text, and_, cast, delete, false, func, insert, literal, literal_column, null, or_, text, true, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
 import models
 import schemas
 import auth
+import events
+import response_cache
+import search
+from pagination import Cursor, Snapshot, SyncToken, encode_cursor, encode_sync_token
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# Rows fetched per round trip by the streaming task export.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+# Maintain the task_stats summary table on every task write and serve /stats from it.
+TASK_STATS_SUMMARY = os.getenv("TASK_STATS_SUMMARY", "false").lower() == "true"
+
+PROJECT_SORT_KEYS = {"id": models.Project.id, "name": models.Project.name}
+TASK_SORT_KEYS = {"id": models.Task.id, "title": models.Task.title}
+TASK_COLUMNS = tuple(models.Task.__table__.c)
+TASK_FIELDS = tuple(column.name for column in TASK_COLUMNS)
+
+
+# KEYSET PAGINATION
+MAX_PAGE_SIZE = 1000
+
+
+def _seek(query, id_column, sort_column, cursor: Cursor | None, limit: int):
+    # Seek past the last row of the previous page instead of scanning `skip` rows.
+    if sort_column is id_column:
+        if cursor is not None:
+            query = query.filter(id_column > cursor.id)
+        return query.order_by(id_column).limit(limit + 1)
+
+    if cursor is not None:
+        query = query.filter(tuple_(sort_column, id_column) > tuple_(cursor.key, cursor.id))
+    return query.order_by(sort_column, id_column).limit(limit + 1)
+
+
+def _page(rows, order_by: str, limit: int):
+    items = rows[:limit]
+    next_cursor = None
+    if items and len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(order_by, last[order_by], last["id"])
+    return items, next_cursor
 
 
 # PROJECT CRUD
-async def get_projects(db: AsyncSession, skip: int = 0, limit: int = 0):
-    result = await db.execute(select(models.Project).options(selectinload(models.Project.tasks)).offset(skip).limit(limit))
-    return result.scalars().all()
+MAX_EMBEDDED_TASKS = 100
 
 
-async def get_project(db: AsyncSession, project_id: int):
-    result = await db.execute(select(models.Project).options(joinedload(models.Project.tasks)).filter(models.Project.id == project_id))
-    return result.scalars().first()
+def _project_summaries():
+    # Counts come from correlated subqueries on the (project_id, completed, id) index,
+    # so listings never load Task rows.
+    task_count = (
+        select(func.count(models.Task.id))
+        .where(models.Task.project_id == models.Project.id)
+        .correlate(models.Project)
+        .scalar_subquery()
+    )
+    completed_count = (
+        select(func.count(models.Task.id))
+        .where(models.Task.project_id == models.Project.id, models.Task.completed == true())
+        .correlate(models.Project)
+        .scalar_subquery()
+    )
+    return select(
+        models.Project.id,
+        models.Project.name,
+        models.Project.description,
+        models.Project.owner_id,
+        task_count.label("task_count"),
+        completed_count.label("completed_count"),
+    )
+
+
+def _project_dicts(result) -> list[dict]:
+    # Same shape as ProjectResponse, since list routes serialize these without validation.
+    return [{**row, "tasks": None} for row in result.mappings()]
+
+
+async def _embed_tasks(db: AsyncSession, projects: list[dict], tasks_limit: int):
+    if not projects:
+        return projects
+
+    # LATERAL keeps the per-project cap inside Postgres: each project reads at most `tasks_limit` index entries.
+    project_ids = select(models.Project.id).filter(models.Project.id.in_([p["id"] for p in projects])).subquery()
+    capped = (
+        select(models.Task.__table__)
+        .filter(models.Task.project_id == project_ids.c.id)
+        .order_by(models.Task.id)
+        .limit(min(tasks_limit, MAX_EMBEDDED_TASKS))
+        .lateral()
+    )
+    result = await db.execute(select(capped).select_from(project_ids).join(capped, true()))
+
+    tasks_by_project = {p["id"]: [] for p in projects}
+    for task in result.mappings():
+        tasks_by_project[task["project_id"]].append(dict(task))
+    for project in projects:
+        project["tasks"] = tasks_by_project[project["id"]]
+    return projects
+
+
+async def get_projects(db: AsyncSession, skip: int = 0, limit: int = 0, owner_id: int = None, include_tasks: bool = False, tasks_limit: int = 20):
+    query = _project_summaries()
+
+    if owner_id is not None:
+        query = query.filter(models.Project.owner_id == owner_id)
+
+    result = await db.execute(query.offset(skip).limit(limit))
+    projects = _project_dicts(result)
+    if include_tasks:
+        await _embed_tasks(db, projects, tasks_limit)
+    return projects
+
+
+async def get_projects_page(db: AsyncSession, owner_id: int = None, cursor: Cursor | None = None, limit: int = 10, order_by: str = "id", include_tasks: bool = False, tasks_limit: int = 20):
+    query = _project_summaries()
+
+    if owner_id is not None:
+        query = query.filter(models.Project.owner_id == owner_id)
+
+    query = _seek(query, models.Project.id, PROJECT_SORT_KEYS[order_by], cursor, limit)
+    result = await db.execute(query)
+    projects, next_cursor = _page(_project_dicts(result), order_by, limit)
+    if include_tasks:
+        await _embed_tasks(db, projects, tasks_limit)
+    return projects, next_cursor
+
+
+async def get_project(db: AsyncSession, project_id: int, include_tasks: bool = False, tasks_limit: int = 20):
+    result = await db.execute(_project_summaries().filter(models.Project.id == project_id))
+    row = result.mappings().first()
+    if row is None:
+        return None
+    project = dict(row)
+    if include_tasks:
+        await _embed_tasks(db, [project], tasks_limit)
+    return project
 
 
 async def create_project(db: AsyncSession, project: schemas.ProjectCreate, user_id: int):
@@ -22,33 +149,68 @@ async def create_project(db: AsyncSession, project: schemas.ProjectCreate, user_
     db.add(db_project)
     await db.commit()
     await db.refresh(db_project)
-    return db_project
+    return {
+        "id": db_project.id,
+        "name": db_project.name,
+        "description": db_project.description,
+        "owner_id": db_project.owner_id,
+        "task_count": 0,
+        "completed_count": 0,
+    }
 
 
 async def delete_project(db: AsyncSession, project_id: int):
-    result = await db.execute(select(models.Project).options(joinedload(models.Project.tasks)).filter(models.Project.id == project_id))
-    db_project = result.scalars().first()
-    if db_project:
-        await db.delete(db_project)
-        await db.commit()
-    return db_project
+    # Tasks go with the project through the ON DELETE CASCADE foreign key, never through Python.
+    result = await db.execute(delete(models.Project.__table__).filter(models.Project.id == project_id).returning(models.Project.id))
+    deleted_id = result.scalar()
+    if deleted_id is not None:
+        await events.publish(db, [events.project_deleted(project_id)])
+    await db.commit()
+    if deleted_id is not None:
+        # Cached task details are not tagged per project, so a project delete expires all of them.
+        await response_cache.invalidate(f"project:{project_id}", "tasks", "project-deletes")
+        search.fallback_index.reset()
+    return deleted_id
 
 
 # TASK CRUD
-async def get_tasks(db: AsyncSession, project_id: int = None, completed: bool = None, owner_id: int = None, skip: int = 0, limit: int = 10):
-    query = select(models.Task)
+async def invalidate_tasks(tasks):
+    # Task rows (anything with id and project_id) that changed: their details, listings and project counts.
+    tags = ["tasks"]
+    for task in tasks:
+        tags += [f"task:{task['id']}", f"project:{task['project_id']}"]
+    await response_cache.invalidate(*tags)
 
+
+def _filter_tasks(query, project_id: int = None, completed: bool = None, owner_id: int = None):
     if project_id is not None:
         query = query.filter(models.Task.project_id == project_id)
 
     if completed is not None:
-        query = query.filter(models.Task.completed == completed)
+        query = query.filter(models.Task.completed == (true() if completed else false()))
 
     if owner_id is not None:
         query = query.filter(models.Task.owner_id == owner_id)
 
+    return query
+
+
+def _task_dicts(result) -> list[dict]:
+    # Listings return plain dicts built from column tuples; no ORM identity map or per-row validation.
+    return [dict(zip(TASK_FIELDS, row)) for row in result.tuples()]
+
+
+async def get_tasks(db: AsyncSession, project_id: int = None, completed: bool = None, owner_id: int = None, skip: int = 0, limit: int = 10):
+    query = _filter_tasks(select(*TASK_COLUMNS), project_id, completed, owner_id)
     result = await db.execute(query.offset(skip).limit(limit))
-    return result.scalars().all()
+    return _task_dicts(result)
+
+
+async def get_tasks_page(db: AsyncSession, project_id: int = None, completed: bool = None, owner_id: int = None, cursor: Cursor | None = None, limit: int = 10, order_by: str = "id"):
+    query = _filter_tasks(select(*TASK_COLUMNS), project_id, completed, owner_id)
+    query = _seek(query, models.Task.id, TASK_SORT_KEYS[order_by], cursor, limit)
+    result = await db.execute(query)
+    return _page(_task_dicts(result), order_by, limit)
 
 
 async def get_task(db: AsyncSession, task_id: int):
@@ -56,6 +218,67 @@ async def get_task(db: AsyncSession, task_id: int):
     return result.scalars().first()
 
 
+async def search_tasks(db: AsyncSession, q: str, project_id: int = None, completed: bool = None, owner_id: int = None, cursor: Cursor | None = None, limit: int = 10):
+    # Best match first, then by id; the cursor seeks on (rank, id).
+    if db.get_bind().dialect.name != "postgresql":
+        return await _search_tasks_in_process(db, q, project_id, completed, owner_id, cursor, limit)
+
+    tsquery = search.tsquery(q)
+    if tsquery is None:
+        return [], None
+    vector = literal_column("tasks.search_vector")
+    matches = func.to_tsquery(search.TS_CONFIG, tsquery)
+    rank = func.ts_rank_cd(vector, matches)
+
+    query = _filter_tasks(select(*TASK_COLUMNS, rank.label("rank")).filter(vector.op("@@")(matches)), project_id, completed, owner_id)
+    if cursor is not None:
+        query = query.filter(or_(rank < cursor.key, and_(rank == cursor.key, models.Task.id > cursor.id)))
+    result = await db.execute(query.order_by(rank.desc(), models.Task.id).limit(limit + 1))
+    return _search_page([dict(zip(TASK_FIELDS + ("rank",), row)) for row in result.tuples()], limit)
+
+
+async def _search_tasks_in_process(db: AsyncSession, q: str, project_id, completed, owner_id, cursor: Cursor | None, limit: int):
+    if not search.fallback_index.loaded:
+        await search.fallback_index.load(db)
+    scores = search.fallback_index.search(q)
+    if not scores:
+        return [], None
+
+    result = await db.execute(_filter_tasks(select(*TASK_COLUMNS).filter(models.Task.id.in_(scores)), project_id, completed, owner_id))
+    rows = _task_dicts(result)
+    for task in rows:
+        task["rank"] = scores[task["id"]]
+    rows.sort(key=lambda task: (-task["rank"], task["id"]))
+    if cursor is not None:
+        rows = [task for task in rows if task["rank"] < cursor.key or (task["rank"] == cursor.key and task["id"] > cursor.id)]
+    return _search_page(rows[:limit + 1], limit)
+
+
+def _search_page(rows: list[dict], limit: int):
+    items, next_cursor = _page(rows, "rank", limit)
+    for item in items:
+        del item["rank"]
+    return items, next_cursor
+
+
+async def project_exists(db: AsyncSession, project_id: int) -> bool:
+    result = await db.execute(select(models.Project.id).filter(models.Project.id == project_id))
+    return result.scalar() is not None
+
+
+async def user_exists(db: AsyncSession, user_id: int) -> bool:
+    result = await db.execute(select(models.User.id).filter(models.User.id == user_id))
+    return result.scalar() is not None
+
+
+async def stream_tasks(db: AsyncSession, project_id: int = None, owner_id: int = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    # Server-side cursor: yields lists of plain row tuples, chunk_size at a time, without building ORM objects.
+    query = _filter_tasks(select(*TASK_COLUMNS), project_id=project_id, owner_id=owner_id).order_by(models.Task.id)
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        yield rows
+
+
 async def create_task(db: AsyncSession, task: schemas.TaskCreate, user_id: int):
     db_task = models.Task(
         title=task.title,
@@ -65,36 +288,342 @@ async def create_task(db: AsyncSession, task: schemas.TaskCreate, user_id: int):
         owner_id=user_id
     )
     db.add(db_task)
+    await db.flush()
+    await _apply_stats(db, _count_tasks([{"project_id": db_task.project_id, "owner_id": user_id, "completed": db_task.completed}]))
+    await events.publish(db, events.task_events("created", [{field: getattr(db_task, field) for field in TASK_FIELDS}]))
     await db.commit()
     await db.refresh(db_task)
+    await response_cache.invalidate("tasks", f"project:{db_task.project_id}")
+    search.index_tasks([{"id": db_task.id, "title": db_task.title, "description": db_task.description}])
     return db_task
 
 
+def _task_changes(task_update: schemas.TaskUpdate) -> dict:
+    # Only fields the client sent; title and completed are NOT NULL, so an explicit null means "leave as is".
+    changes = task_update.model_dump(exclude_unset=True, include={"title", "description", "completed"})
+    return {field: value for field, value in changes.items() if value is not None or field == "description"}
+
+
+async def _update_task(db: AsyncSession, task_id: int, changes: dict):
+    if not changes:
+        return await get_task(db, task_id)
+
+    before = await _lock_completed(db, [task_id], changes)
+    result = await db.execute(
+        update(models.Task.__table__).filter(models.Task.id == task_id).values(**changes).returning(*TASK_COLUMNS)
+    )
+    task = result.mappings().first()
+    await _apply_stats(db, _count_completed_changes([task] if task else [], before))
+    await events.publish(db, events.task_events("updated", [task] if task else []))
+    await db.commit()
+    if task is not None:
+        await invalidate_tasks([task])
+        search.index_tasks([task])
+    return task
+
+
 async def update_task(db: AsyncSession, task_id: int, task_update: schemas.TaskBase):
-    result = await db.execute(select(models.Task).filter(models.Task.id == task_id))
-    db_task = result.scalars().first()
+    return await _update_task(db, task_id, task_update.model_dump(include={"title", "description", "completed"}))
 
-    if db_task:
-        db_task.title = task_update.title
-        db_task.description = task_update.description
-        db_task.completed = task_update.completed
-        await db.commit()
-        await db.refresh(db_task)
-    return db_task
+
+async def patch_task(db: AsyncSession, task_id: int, task_update: schemas.TaskUpdate):
+    return await _update_task(db, task_id, _task_changes(task_update))
 
 
 async def delete_task(db: AsyncSession, task_id: int):
-    result = await db.execute(select(models.Task).filter(models.Task.id == task_id))
-    db_task = result.scalars().first()
-    if db_task:
-        await db.delete(db_task)
-        await db.commit()
-    return db_task
+    result = await db.execute(
+        delete(models.Task.__table__).filter(models.Task.id == task_id).returning(*TASK_COLUMNS)
+    )
+    deleted = result.mappings().first()
+    await _apply_stats(db, _count_tasks([deleted] if deleted else [], sign=-1))
+    await events.publish(db, events.task_events("deleted", [deleted] if deleted else []))
+    await db.commit()
+    if deleted is None:
+        return None
+    await invalidate_tasks([deleted])
+    search.unindex_tasks([deleted["id"]])
+    return deleted["id"]
+
+
+# BULK TASK CRUD
+def _batches(items: list, batch_size: int):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _missing_ids(ids: list[int], found: set[int]) -> list[dict]:
+    return [{"index": index, "id": task_id, "detail": "Task not found"} for index, task_id in enumerate(ids) if task_id not in found]
+
+
+async def create_tasks(db: AsyncSession, tasks: list[schemas.TaskCreate], user_id: int, batch_size: int = BULK_BATCH_SIZE):
+    project_ids = {task.project_id for task in tasks}
+    result = await db.execute(select(models.Project.id).filter(models.Project.id.in_(project_ids)))
+    existing_projects = set(result.scalars())
+
+    rows, errors = [], []
+    for index, task in enumerate(tasks):
+        if task.project_id not in existing_projects:
+            errors.append({"index": index, "detail": "Project not found"})
+            continue
+        rows.append({
+            "title": task.title,
+            "description": task.description,
+            "completed": task.completed,
+            "project_id": task.project_id,
+            "owner_id": user_id
+        })
+
+    created = []
+    for batch in _batches(rows, batch_size):
+        result = await db.execute(insert(models.Task.__table__).values(batch).returning(*TASK_COLUMNS))
+        created.extend(result.mappings().all())
+    await _apply_stats(db, _count_tasks(created))
+    await events.publish(db, events.task_events("created", created))
+    await db.commit()
+    await invalidate_tasks(created)
+    search.index_tasks(created)
+    return created, errors
+
+
+async def update_tasks(db: AsyncSession, task_update: schemas.TaskBulkUpdate, batch_size: int = BULK_BATCH_SIZE):
+    changes = _task_changes(task_update)
+    ids = list(dict.fromkeys(task_update.ids))
+
+    updated, before = [], {}
+    for batch in _batches(ids, batch_size):
+        if changes:
+            before.update(await _lock_completed(db, batch, changes))
+            query = update(models.Task.__table__).filter(models.Task.id.in_(batch)).values(**changes).returning(*TASK_COLUMNS)
+        else:
+            query = select(*TASK_COLUMNS).filter(models.Task.id.in_(batch))
+        result = await db.execute(query)
+        updated.extend(result.mappings().all())
+    await _apply_stats(db, _count_completed_changes(updated, before))
+    if changes:
+        await events.publish(db, events.task_events("updated", updated))
+    await db.commit()
+    if changes:
+        await invalidate_tasks(updated)
+        search.index_tasks(updated)
+    return updated, _missing_ids(task_update.ids, {task["id"] for task in updated})
+
+
+async def delete_tasks(db: AsyncSession, ids: list[int], batch_size: int = BULK_BATCH_SIZE):
+    deleted = []
+    for batch in _batches(list(dict.fromkeys(ids)), batch_size):
+        result = await db.execute(
+            delete(models.Task.__table__).filter(models.Task.id.in_(batch)).returning(*TASK_COLUMNS)
+        )
+        deleted.extend(result.mappings().all())
+    await _apply_stats(db, _count_tasks(deleted, sign=-1))
+    await events.publish(db, events.task_events("deleted", deleted))
+    await db.commit()
+    await invalidate_tasks(deleted)
+    deleted_ids = [task["id"] for task in deleted]
+    search.unindex_tasks(deleted_ids)
+    return deleted_ids, _missing_ids(ids, set(deleted_ids))
+
+
+async def delete_project_tasks(db: AsyncSession, project_id: int, limit: int = BULK_BATCH_SIZE) -> list[int]:
+    # Deletes up to `limit` of a project's tasks in one transaction, so a large project can be emptied in steps.
+    result = await db.execute(
+        select(models.Task.id).filter(models.Task.project_id == project_id).order_by(models.Task.id).limit(limit)
+    )
+    ids = list(result.scalars())
+    if not ids:
+        return []
+    deleted_ids, _ = await delete_tasks(db, ids, batch_size=limit)
+    return deleted_ids
+
+
+async def count_project_tasks(db: AsyncSession, project_id: int) -> int:
+    result = await db.execute(select(func.count()).select_from(models.Task).filter(models.Task.project_id == project_id))
+    return result.scalar()
+
+
+# TASK STATS
+def _count_tasks(tasks, sign: int = 1) -> dict:
+    # (project_id, owner_id) -> [task_count delta, completed_count delta]
+    deltas = {}
+    for task in tasks:
+        counts = deltas.setdefault((task["project_id"], task["owner_id"]), [0, 0])
+        counts[0] += sign
+        counts[1] += sign if task["completed"] else 0
+    return deltas
+
+
+def _count_completed_changes(tasks, before: dict) -> dict:
+    deltas = {}
+    for task in tasks:
+        was_completed = before.get(task["id"])
+        if was_completed is not None and was_completed != task["completed"]:
+            counts = deltas.setdefault((task["project_id"], task["owner_id"]), [0, 0])
+            counts[1] += 1 if task["completed"] else -1
+    return deltas
+
+
+async def _lock_completed(db: AsyncSession, ids: list[int], changes: dict) -> dict:
+    # The pre-update `completed` values, locked so a concurrent update cannot change them under us.
+    if not TASK_STATS_SUMMARY or "completed" not in changes:
+        return {}
+    result = await db.execute(select(models.Task.id, models.Task.completed).filter(models.Task.id.in_(ids)).with_for_update())
+    return dict(result.tuples().all())
+
+
+async def _apply_stats(db: AsyncSession, deltas: dict):
+    # Runs in the write's own transaction; rows are upserted in key order so concurrent writers cannot deadlock.
+    rows = [
+        {"project_id": project_id, "owner_id": owner_id, "task_count": total, "completed_count": completed}
+        for (project_id, owner_id), (total, completed) in sorted(deltas.items())
+        if total or completed
+    ]
+    if not TASK_STATS_SUMMARY or not rows:
+        return
+    table = models.TaskStats.__table__
+    query = pg_insert(table).values(rows)
+    query = query.on_conflict_do_update(
+        index_elements=[table.c.project_id, table.c.owner_id],
+        set_={
+            "task_count": table.c.task_count + query.excluded.task_count,
+            "completed_count": table.c.completed_count + query.excluded.completed_count,
+        },
+    )
+    await db.execute(query)
+
+
+async def rebuild_task_stats(db: AsyncSession):
+    # Recomputes the summary from tasks, e.g. after running with TASK_STATS_SUMMARY off for a while.
+    await db.execute(text("LOCK TABLE tasks IN SHARE MODE"))
+    await db.execute(delete(models.TaskStats.__table__))
+    totals = select(
+        models.Task.project_id,
+        models.Task.owner_id,
+        func.count(models.Task.id),
+        func.count(models.Task.id).filter(models.Task.completed == true()),
+    ).group_by(models.Task.project_id, models.Task.owner_id)
+    await db.execute(
+        insert(models.TaskStats.__table__).from_select(["project_id", "owner_id", "task_count", "completed_count"], totals)
+    )
+    await db.commit()
+
+
+def _stats_columns():
+    if TASK_STATS_SUMMARY:
+        stats = models.TaskStats
+        return stats.project_id, stats.owner_id, func.sum(stats.task_count), func.sum(stats.completed_count)
+    task = models.Task
+    return task.project_id, task.owner_id, func.count(task.id), func.count(task.id).filter(task.completed == true())
+
+
+async def get_task_stats(db: AsyncSession, project_id: int = None, owner_id: int = None, group_by: str = None):
+    # Counts are aggregated in the database: one row for the totals plus one per group.
+    project_column, owner_column, total, completed = _stats_columns()
+
+    def counts(query):
+        if project_id is not None:
+            query = query.filter(project_column == project_id)
+        if owner_id is not None:
+            query = query.filter(owner_column == owner_id)
+        return query
+
+    result = await db.execute(counts(select(func.coalesce(total, 0), func.coalesce(completed, 0))))
+    task_count, completed_count = result.one()
+    stats = {"total": task_count, "completed": completed_count, "open": task_count - completed_count, "groups": []}
+
+    if group_by is not None:
+        group_column = project_column if group_by == "project" else owner_column
+        result = await db.execute(
+            counts(select(group_column, total, completed)).group_by(group_column).having(total > 0).order_by(group_column)
+        )
+        stats["groups"] = [
+            {f"{group_by}_id": key, "total": group_total, "completed": group_completed, "open": group_total - group_completed}
+            for key, group_total, group_completed in result.tuples()
+        ]
+    return stats
+
+
+# SYNC
+MAX_SYNC_CHANGES = 5000
+# Sources of GET /sync, in the order they sort within one version.
+SYNC_PROJECTS, SYNC_TASKS, SYNC_TOMBSTONES = 0, 1, 2
+
+
+def _json_object(columns):
+    return func.jsonb_build_object(*[part for column in columns for part in (literal_column(f"'{column.name}'"), column)], type_=JSONB)
+
+
+def _changed_in_window(version, token: SyncToken, until: Snapshot):
+    # Committed after the `since` snapshot (not visible in it) and by the `until` one (visible in it).
+    conditions = [version < until.xmax, version.not_in(until.xip)]
+    if token.since is not None:
+        conditions += [version >= token.since.xmin, or_(version >= token.since.xmax, version.in_(token.since.xip))]
+    return and_(*conditions)
+
+
+def _after(version, id_column, source: int, after: tuple[int, int, int] | None):
+    # Keyset on (version, source, id); the source is constant within each part of the union.
+    if after is None:
+        return true()
+    after_version, after_source, after_id = after
+    if source < after_source:
+        return version > after_version
+    if source > after_source:
+        return version >= after_version
+    return tuple_(version, id_column) > (after_version, after_id)
+
+
+async def get_changes(db: AsyncSession, token: SyncToken, project_id: int = None, limit: int = 500):
+    """Tasks and projects written, and those deleted, between two transaction snapshots, in version order.
+
+    A token without `until` starts a window ending at the current snapshot; pages within the window
+    carry it along, and the last page hands out a token whose `since` is that snapshot.
+    """
+    until = token.until
+    if until is None:
+        result = await db.execute(select(cast(func.pg_current_snapshot(), Text)))
+        xmin, xmax, xip = result.scalar().split(":")
+        until = Snapshot(int(xmin), int(xmax), tuple(int(xid) for xid in xip.split(",") if xid))
+
+    tables = [(SYNC_PROJECTS, models.Project.__table__), (SYNC_TASKS, models.Task.__table__)]
+    if token.since is not None:
+        tables.append((SYNC_TOMBSTONES, models.SyncTombstone.__table__))
+
+    parts = []
+    for source, table in tables:
+        version = literal_column(f"{table.name}.version")
+        if source == SYNC_TOMBSTONES:
+            kind, entity_id, deleted, data = table.c.entity, table.c.entity_id, true(), null().cast(JSONB)
+        else:
+            kind, entity_id, deleted, data = literal("project" if source == SYNC_PROJECTS else "task"), table.c.id, false(), _json_object(table.c)
+        query = select(
+            version.label("version"), literal(source).label("source"), table.c.id.label("row_id"),
+            kind.label("type"), entity_id.label("id"), deleted.label("deleted"), data.label("data")
+        ).where(_changed_in_window(version, token, until), _after(version, table.c.id, source, token.after))
+        if project_id is not None:
+            query = query.where((table.c.id if source == SYNC_PROJECTS else table.c.project_id) == project_id)
+        parts.append(query.order_by(version, table.c.id).limit(limit + 1))
+
+    changes = union_all(*parts).subquery()
+    result = await db.execute(select(changes).order_by(changes.c.version, changes.c.source, changes.c.row_id).limit(limit + 1))
+    rows = result.mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        last = rows[-1]
+        next_token = SyncToken(since=token.since, until=until, after=(last["version"], last["source"], last["row_id"]))
+    else:
+        next_token = SyncToken(since=until)
+    return {
+        "changes": [{field: row[field] for field in ("type", "id", "version", "deleted", "data")} for row in rows],
+        "next": encode_sync_token(next_token),
+        "has_more": has_more,
+    }
 
 
 # USER CRUD
 async def create_user(db: AsyncSession, user: schemas.UserCreate):
-    hashed_password = auth.hash_password(user.password)
+    hashed_password = await auth.hash_password_async(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -104,12 +633,20 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate):
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    auth.principal_cache.invalidate(db_user.username)
     return db_user
 
 
 async def authenticate_user(db: AsyncSession, username: str, password: str):
     result = await db.execute(select(models.User).filter(models.User.username == username))
     user = result.scalars().first()
-    if user and auth.verify_password(password, user.hashed_password):
-        return user
-    return None
+    if not user:
+        return None
+
+    verified, new_hash = await auth.verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
+        return None
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+    return user
@@ -1,8 +1,17 @@
 import os
+import time
+import uuid
+from functools import cached_property
 
 from dotenv import load_dotenv
 
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from lru import TTLCache
 
 load_dotenv()
 
@@ -13,11 +22,225 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-
-async_engine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSessionLocal = async_sessionmaker(
-    bind=async_engine,
-    expire_on_commit=False,
-    class_=AsyncSession
+# ASYNC_DATABASE_URL overrides the POSTGRES_* settings, e.g. to go through PgBouncer.
+DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 )
+
+# Connection pool, sized per worker process
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "5"))
+POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", "10"))
+POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "30"))
+POSTGRES_POOL_RECYCLE = int(os.getenv("POSTGRES_POOL_RECYCLE", "1800"))
+POSTGRES_POOL_PRE_PING = os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() == "true"
+POSTGRES_STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", "100"))
+# PgBouncer in transaction mode cannot keep prepared statements across transactions.
+POSTGRES_PGBOUNCER = os.getenv("POSTGRES_PGBOUNCER", "false").lower() == "true"
+
+# Read replicas: comma-separated async URLs that GET routes read from, round-robin.
+POSTGRES_REPLICA_URLS = [url.strip() for url in os.getenv("POSTGRES_REPLICA_URLS", "").split(",") if url.strip()]
+# How long a replica that failed to connect is skipped before it is tried again.
+POSTGRES_REPLICA_RETRY_SECONDS = float(os.getenv("POSTGRES_REPLICA_RETRY_SECONDS", "30"))
+# After a write, the same client keeps reading from the primary for this long.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    # Times how long each checkout waits for a free connection (including connecting), per pool, so the
+    # primary's and each replica's waits are reported apart.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record_wait(time.perf_counter() - started)
+
+
+def engine_options(url: str) -> dict:
+    options = {
+        "echo": False,
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": POSTGRES_POOL_SIZE,
+        "max_overflow": POSTGRES_MAX_OVERFLOW,
+        "pool_timeout": POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": POSTGRES_POOL_PRE_PING,
+    }
+    if url.startswith("postgresql+asyncpg"):
+        if POSTGRES_PGBOUNCER:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        else:
+            options["connect_args"] = {
+                "statement_cache_size": POSTGRES_STATEMENT_CACHE_SIZE,
+                "prepared_statement_cache_size": POSTGRES_STATEMENT_CACHE_SIZE,
+            }
+    return options
+
+
+class PrimarySession(Session):
+    pass
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _mark_session_wrote(session):
+    session.info["wrote"] = True
+
+
+# Each engine is passed to these as it is built, e.g. to attach query instrumentation.
+_engine_hooks = []
+_engines = []
+
+
+def on_engine_created(hook):
+    _engine_hooks.append(hook)
+    for engine in _engines:
+        hook(engine)
+
+
+def _create_engine(url: str):
+    engine = create_async_engine(url, **engine_options(url))
+    _engines.append(engine)
+    for hook in _engine_hooks:
+        hook(engine)
+    return engine
+
+
+# The primary engine and session factory are built on first use, which keeps the dialect
+# and driver imports out of `import database`; read them as database.async_engine and
+# database.AsyncSessionLocal.
+_async_engine = None
+_session_factory = None
+
+
+def get_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = _create_engine(DATABASE_URL)
+    return _async_engine
+
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = async_sessionmaker(
+            bind=get_engine(),
+            expire_on_commit=False,
+            class_=AsyncSession,
+            sync_session_class=PrimarySession
+        )
+    return _session_factory
+
+
+def __getattr__(name: str):
+    if name == "async_engine":
+        return get_engine()
+    if name == "AsyncSessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.down_until = 0.0
+
+    @cached_property
+    def engine(self):
+        return _create_engine(self.url)
+
+    @cached_property
+    def session_factory(self):
+        return async_sessionmaker(bind=self.engine, expire_on_commit=False, class_=AsyncSession)
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._next = 0
+
+    def candidates(self) -> list[Replica]:
+        # Round-robin starting point, skipping replicas that recently failed.
+        if not self.replicas:
+            return []
+        start = self._next
+        self._next = (self._next + 1) % len(self.replicas)
+        rotated = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in rotated if replica.healthy]
+
+    def mark_down(self, replica: Replica):
+        replica.down_until = time.monotonic() + POSTGRES_REPLICA_RETRY_SECONDS
+
+
+replica_router = ReplicaRouter(POSTGRES_REPLICA_URLS)
+recent_writers = TTLCache(maxsize=100_000, ttl=READ_YOUR_WRITES_SECONDS)
+
+
+def mark_write(client_key: str):
+    recent_writers.set(client_key, True)
+
+
+def reads_from_primary(client_key: str) -> bool:
+    return not replica_router.replicas or recent_writers.get(client_key, False)
+
+
+async def dispose_engines():
+    for engine in _engines:
+        await engine.dispose()
+
+
+def _discard_pools_after_fork():
+    # A forked worker opens its own connections; close=False leaves the parent's sockets to the parent.
+    for engine in _engines:
+        engine.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_discard_pools_after_fork)
+
+
+def _pool_status(engine) -> dict:
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "checkouts": pool.wait_stats.checkouts,
+        "wait_seconds_total": round(pool.wait_stats.wait_seconds_total, 6),
+        "wait_seconds_max": round(pool.wait_stats.wait_seconds_max, 6),
+    }
+
+
+def get_pool_status() -> dict:
+    return {
+        **_pool_status(get_engine()),
+        "max_overflow": POSTGRES_MAX_OVERFLOW,
+        "replicas": [
+            {"host": make_url(replica.url).host, "healthy": replica.healthy, **_pool_status(replica.engine)}
+            for replica in replica_router.replicas
+        ],
+    }
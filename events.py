@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import os
+
+import anyio
+from sqlalchemy import event, text
+
+import database
+
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "task_events")
+# Events buffered per subscriber; a subscriber that falls this far behind gets one "resync" instead.
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Writes touching more tasks than this send one "resync" per project instead of an event per task.
+EVENTS_MAX_PER_WRITE = int(os.getenv("EVENTS_MAX_PER_WRITE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_RECONNECT_SECONDS = float(os.getenv("EVENTS_RECONNECT_SECONDS", "2"))
+# NOTIFY payloads are capped at 8000 bytes; larger events go out with only the task id.
+MAX_PAYLOAD_BYTES = 7900
+
+logger = logging.getLogger("task_tracker.events")
+
+_NOTIFY = text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload")
+
+
+def task_events(kind: str, tasks) -> list[dict]:
+    # kind is created, updated or deleted; tasks are rows with at least id and project_id.
+    if len(tasks) > EVENTS_MAX_PER_WRITE:
+        return [resync(project_id) for project_id in sorted({task["project_id"] for task in tasks})]
+    return [{"type": f"task.{kind}", "project_id": task["project_id"], "task": dict(task)} for task in tasks]
+
+
+def project_deleted(project_id: int) -> dict:
+    return {"type": "project.deleted", "project_id": project_id}
+
+
+def resync(project_id: int) -> dict:
+    # Tells the client its view may have missed events and should be reloaded.
+    return {"type": "resync", "project_id": project_id}
+
+
+def _payload(message: dict) -> str:
+    payload = json.dumps(message, separators=(",", ":"), default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES and "task" in message:
+        payload = json.dumps({**message, "task": {"id": message["task"]["id"]}}, separators=(",", ":"))
+    return payload
+
+
+async def publish(db, messages: list[dict]):
+    """Sends `messages` when `db`'s transaction commits, and not at all if it rolls back.
+
+    On Postgres they go through NOTIFY to every worker's listener; elsewhere they are dispatched
+    to this process's subscribers only.
+    """
+    payloads = [_payload(message) for message in messages]
+    if not payloads:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(_NOTIFY, {"channel": EVENTS_CHANNEL, "payloads": payloads})
+    else:
+        db.info.setdefault("pending_events", []).extend(payloads)
+
+
+@event.listens_for(database.PrimarySession, "after_commit")
+def _dispatch_pending(session):
+    for payload in session.info.pop("pending_events", ()):
+        hub.dispatch(payload)
+
+
+@event.listens_for(database.PrimarySession, "after_rollback")
+def _drop_pending(session):
+    session.info.pop("pending_events", None)
+
+
+class Subscription:
+    def __init__(self, hub: "Hub", project_id: int, maxsize: int):
+        self.hub = hub
+        self.project_id = project_id
+        # (JSON payload, ready-made SSE frame), so each event is encoded once however many subscribers get it.
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(maxsize)
+
+    def put(self, message: tuple[str, str]):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A partial history is worse than none: drop the backlog and have the client reload.
+            self.hub.dropped += self.queue.qsize()
+            self.hub.resyncs += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.hub.encode(_payload(resync(self.project_id)), "resync"))
+
+
+class Hub:
+    """Fans task events out to this worker's subscribers, from one shared LISTEN connection on Postgres."""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: dict[int, set[Subscription]] = {}
+        self.listening = False
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.reconnects = 0
+        self._listener: asyncio.Task | None = None
+
+    @staticmethod
+    def encode(payload: str, event_type: str) -> tuple[str, str]:
+        return payload, f"event: {event_type}\ndata: {payload}\n\n"
+
+    def subscribe(self, project_id: int) -> Subscription:
+        if self._listener is None and database.async_engine.dialect.name == "postgresql":
+            self._listener = asyncio.create_task(self._listen())
+        subscription = Subscription(self, project_id, self.queue_size)
+        self.subscribers.setdefault(project_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self.subscribers.get(subscription.project_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[subscription.project_id]
+
+    def dispatch(self, payload: str):
+        self.received += 1
+        message = json.loads(payload)
+        subscribers = self.subscribers.get(message["project_id"])
+        if not subscribers:
+            return
+        encoded = self.encode(payload, message["type"])
+        for subscription in subscribers:
+            subscription.put(encoded)
+        self.delivered += len(subscribers)
+
+    def resync_all(self):
+        for project_id, subscribers in self.subscribers.items():
+            encoded = self.encode(_payload(resync(project_id)), "resync")
+            for subscription in subscribers:
+                subscription.put(encoded)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.dispatch(payload)
+
+    async def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                async with database.async_engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    closed = asyncio.Event()
+                    raw.add_termination_listener(lambda _: closed.set())
+                    await raw.add_listener(EVENTS_CHANNEL, self._on_notify)
+                    self.listening = True
+                    if connected_before:
+                        # Whatever was notified while we were disconnected is lost.
+                        self.reconnects += 1
+                        self.resync_all()
+                    connected_before = True
+                    try:
+                        while not closed.is_set():
+                            try:
+                                await asyncio.wait_for(closed.wait(), EVENTS_HEARTBEAT_SECONDS)
+                            except asyncio.TimeoutError:
+                                # An idle connection only notices a dead peer when it sends something.
+                                await raw.execute("SELECT 1")
+                    finally:
+                        # Never hand a LISTENing connection back to the pool.
+                        self.listening = False
+                        await conn.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event listener connection failed, retrying in %.0fs", EVENTS_RECONNECT_SECONDS)
+            await asyncio.sleep(EVENTS_RECONNECT_SECONDS)
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> dict:
+        return {
+            "listening": self.listening,
+            "projects": len(self.subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "reconnects": self.reconnects,
+        }
+
+
+hub = Hub()
+
+
+def ready(project_id: int) -> str:
+    # First message of every stream: events from here on will arrive, so the client can load its state now.
+    return _payload({"type": "ready", "project_id": project_id})
+
+
+async def sse_stream(project_id: int):
+    # Subscribes inside the generator, so a client gone before streaming starts leaves nothing behind.
+    subscription = hub.subscribe(project_id)
+    try:
+        yield hub.encode(ready(project_id), "ready")[1]
+        while True:
+            try:
+                _, frame = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment lines keep proxies from timing out an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            yield frame
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def websocket_stream(websocket, project_id: int):
+    subscription = hub.subscribe(project_id)
+
+    async def send_events():
+        await websocket.send_text(ready(project_id))
+        while True:
+            payload, _ = await subscription.queue.get()
+            await websocket.send_text(payload)
+
+    async def wait_for_close(cancel_scope):
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        cancel_scope.cancel()
+
+    # The same disconnect handling as Starlette's StreamingResponse: whichever side ends first cancels the other.
+    try:
+        async with anyio.create_task_group() as group:
+            group.start_soon(wait_for_close, group.cancel_scope)
+            await send_events()
+    finally:
+        hub.unsubscribe(subscription)
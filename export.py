@@ -0,0 +1,33 @@
+import csv
+import io
+import json
+
+# Media type and file extension per export format.
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def ndjson_chunk(fields: list[str], rows) -> bytes:
+    return "".join(json.dumps(dict(zip(fields, row)), separators=(",", ":")) + "\n" for row in rows).encode()
+
+
+def csv_chunk(fields: list[str], rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def encode(fields: list[str], chunks, format: str):
+    # Serializes each chunk of row tuples as it arrives, so only one chunk is held in memory.
+    if format == "csv":
+        yield csv_chunk(fields, [], header=True)
+        async for rows in chunks:
+            yield csv_chunk(fields, rows)
+    else:
+        async for rows in chunks:
+            yield ndjson_chunk(fields, rows)
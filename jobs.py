@@ -0,0 +1,450 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, event, insert, or_, update
+from sqlalchemy.exc import DBAPIError, IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.future import select
+
+import crud
+import database
+import models
+import schemas
+
+# "memory" keeps jobs in the worker that accepted them; "database" keeps them in the jobs table, so any worker
+# can report on them and a job whose worker died is resumed by another one. "auto" is memory for a single
+# worker and database for more (see configure); memory is refused for more than one worker under serve.py.
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "auto").lower()
+# Jobs running at once per worker; each holds at most one pooled connection at a time.
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "2"))
+# Rows per step; every step is its own transaction.
+JOBS_CHUNK_SIZE = int(os.getenv("JOBS_CHUNK_SIZE", str(crud.BULK_BATCH_SIZE)))
+# Tries per step before the job fails; retries wait JOBS_RETRY_SECONDS, doubling each time.
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_SECONDS = float(os.getenv("JOBS_RETRY_SECONDS", "1"))
+# Finished jobs stay visible to GET /jobs/{id} for this long.
+JOBS_RETENTION_SECONDS = float(os.getenv("JOBS_RETENTION_SECONDS", "3600"))
+# Database backend: how often each worker looks for unclaimed jobs, and how long a claim lasts unless renewed.
+# The worker running a job renews its claim every third of that, also while a step is still running.
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "5"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "300"))
+
+FINISHED = ("succeeded", "failed")
+PUBLIC_FIELDS = tuple(schemas.JobResponse.model_fields)
+
+logger = logging.getLogger("task_tracker.jobs")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def public(job: dict) -> dict:
+    return {field: job[field] for field in PUBLIC_FIELDS}
+
+
+def _retryable(exc: Exception) -> bool:
+    # Lost connections, deadlocks and pool timeouts may pass; constraint violations will not.
+    return isinstance(exc, (DBAPIError, OSError, PoolTimeoutError)) and not isinstance(exc, IntegrityError)
+
+
+class ClaimLost(Exception):
+    """Another worker has claimed the job since this one did; this worker must stop running it."""
+
+
+def _describe(exc: Exception) -> str:
+    # Just the first line: database errors go on with the full SQL statement.
+    message = str(exc).splitlines()[0][:200] if str(exc) else ""
+    return f"{type(exc).__name__}: {message}"
+
+
+class MemoryStore:
+    backend = "memory"
+    shared = False
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+
+    async def insert(self, job: dict):
+        await self.prune()
+        self.jobs[job["id"]] = job
+
+    async def get(self, job_id: str) -> dict | None:
+        return self.jobs.get(job_id)
+
+    def claimed(self, job: dict) -> dict:
+        return job
+
+    async def claim_next(self, exclude: list[str]) -> dict | None:
+        return None
+
+    async def save(self, job: dict):
+        pass
+
+    def checkpoint(self, db, job: dict, **values):
+        pass
+
+    async def renew(self, job: dict) -> bool:
+        return True
+
+    async def release(self, jobs: list[dict]):
+        pass
+
+    async def prune(self):
+        cutoff = _now() - timedelta(seconds=JOBS_RETENTION_SECONDS)
+        for job_id in [job_id for job_id, job in self.jobs.items() if job["status"] in FINISHED and job["updated_at"] < cutoff]:
+            del self.jobs[job_id]
+
+
+class DatabaseStore:
+    backend = "database"
+    shared = True
+    table = models.Job.__table__
+
+    async def insert(self, job: dict):
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(insert(self.table).values(**job))
+            await db.commit()
+
+    async def get(self, job_id: str) -> dict | None:
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(select(*self.table.c).filter(self.table.c.id == job_id))
+            row = result.mappings().first()
+        return dict(row) if row is not None else None
+
+    def claimed(self, job: dict) -> dict:
+        # A job inserted already claimed by this worker, so no poller can take it before it starts.
+        return job | {
+            "status": "running",
+            "locked_until": job["updated_at"] + timedelta(seconds=JOBS_LEASE_SECONDS),
+            "claim_token": uuid.uuid4().hex,
+        }
+
+    async def claim_next(self, exclude: list[str]) -> dict | None:
+        # Skips the jobs this worker is running: one whose claim lapsed is still this worker's to finish.
+        claimable = and_(
+            or_(
+                self.table.c.status == "queued",
+                and_(self.table.c.status == "running", self.table.c.locked_until < _now())
+            ),
+            self.table.c.id.not_in(exclude)
+        )
+        oldest = (
+            select(self.table.c.id).filter(claimable).order_by(self.table.c.created_at).limit(1)
+            .with_for_update(skip_locked=True).scalar_subquery()
+        )
+        now = _now()
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(self.table)
+                .filter(self.table.c.id == oldest, claimable)
+                .values(
+                    status="running",
+                    updated_at=now,
+                    locked_until=now + timedelta(seconds=JOBS_LEASE_SECONDS),
+                    claim_token=uuid.uuid4().hex
+                )
+                .returning(*self.table.c)
+            )
+            row = result.mappings().first()
+            await db.commit()
+        return dict(row) if row is not None else None
+
+    def _values(self, job: dict, **values) -> dict:
+        values = {key: job[key] for key in ("status", "done", "total", "result", "error", "retries")} | values
+        values["updated_at"] = _now()
+        values["locked_until"] = values["updated_at"] + timedelta(seconds=JOBS_LEASE_SECONDS) if values["status"] == "running" else None
+        return values
+
+    def _owned(self, job: dict):
+        return and_(self.table.c.id == job["id"], self.table.c.claim_token == job["claim_token"])
+
+    async def save(self, job: dict):
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(update(self.table).filter(self._owned(job)).values(**self._values(job)))
+            if not result.rowcount:
+                raise ClaimLost()
+            await db.commit()
+
+    def checkpoint(self, db, job: dict, **values):
+        # Run by _write_checkpoint inside `db`'s next commit, so the job's progress lands with the step's rows. It
+        # only matches while this worker holds the claim and nobody has moved the job past this step meanwhile.
+        db.info["job_checkpoint"] = (
+            update(self.table)
+            .filter(self._owned(job), self.table.c.done == job["done"])
+            .values(**self._values(job, **values))
+        )
+
+    async def renew(self, job: dict) -> bool:
+        async with database.AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(self.table)
+                .filter(self._owned(job), self.table.c.status == "running")
+                .values(locked_until=_now() + timedelta(seconds=JOBS_LEASE_SECONDS))
+            )
+            await db.commit()
+        return bool(result.rowcount)
+
+    async def release(self, jobs: list[dict]):
+        # Jobs interrupted by a shutdown go back to the queue rather than waiting out their claim.
+        if not jobs:
+            return
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(
+                update(self.table)
+                .filter(or_(*(self._owned(job) for job in jobs)), self.table.c.status == "running")
+                .values(status="queued", locked_until=None, claim_token=None)
+            )
+            await db.commit()
+
+    async def prune(self):
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(
+                delete(self.table).filter(
+                    self.table.c.status.in_(FINISHED),
+                    self.table.c.updated_at < _now() - timedelta(seconds=JOBS_RETENTION_SECONDS)
+                )
+            )
+            await db.commit()
+
+
+@event.listens_for(database.PrimarySession, "before_commit")
+def _write_checkpoint(session):
+    statement = session.info.pop("job_checkpoint", None)
+    if statement is not None and not session.execute(statement).rowcount:
+        # Fails the commit, so the step's rows roll back with it.
+        raise ClaimLost()
+
+
+# JOB KINDS
+# Each handler runs one step of a job in its own transaction and returns True once the job is complete.
+# A failed step is retried as a whole, so steps must be safe to repeat after a rollback.
+async def _delete_project(job: dict, store) -> bool:
+    project_id = job["params"]["project_id"]
+    async with database.AsyncSessionLocal() as db:
+        if job["total"] is None:
+            job["total"] = await crud.count_project_tasks(db, project_id)
+        deleted = await crud.delete_project_tasks(db, project_id, JOBS_CHUNK_SIZE)
+        job["done"] += len(deleted)
+        if len(deleted) == JOBS_CHUNK_SIZE:
+            return False
+        # Tasks added since the last step go with the project through the ON DELETE CASCADE.
+        deleted_id = await crud.delete_project(db, project_id)
+    job["result"] = {"deleted_tasks": job["done"], "project_deleted": deleted_id is not None}
+    return True
+
+
+async def _import_tasks(job: dict, store) -> bool:
+    tasks = job["params"]["tasks"]
+    start = job["done"]
+    chunk = tasks[start:start + JOBS_CHUNK_SIZE]
+    result = job["result"] or {"created": 0, "errors": []}
+    async with database.AsyncSessionLocal() as db:
+        # The offset commits with the chunk's rows, and only while this worker still holds the claim, so no chunk is
+        # imported twice; only the counts of a chunk whose worker died before saving them can miss the result.
+        store.checkpoint(db, job, done=start + len(chunk), result=result)
+        created, errors = await crud.create_tasks(db, [schemas.TaskCreate.model_validate(task) for task in chunk], job["owner_id"])
+    job["done"] = start + len(chunk)
+    job["result"] = {
+        "created": result["created"] + len(created),
+        "errors": result["errors"] + [{**error, "index": error["index"] + start} for error in errors],
+    }
+    return job["done"] >= len(tasks)
+
+
+HANDLERS = {
+    "delete_project": _delete_project,
+    "import_tasks": _import_tasks,
+}
+
+
+class Runner:
+    """Runs jobs as tasks on this worker's event loop, at most `concurrency` at a time."""
+
+    def __init__(self, store, concurrency: int = JOBS_CONCURRENCY):
+        self.store = store
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks: dict[str, asyncio.Task] = {}
+        # Jobs this worker is running, as claimed.
+        self.running: dict[str, dict] = {}
+        # Submitted jobs being inserted to run here, which already count against `concurrency`.
+        self.reserved = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self._poller: asyncio.Task | None = None
+
+    async def submit(self, kind: str, params: dict, owner_id: int | None = None, total: int | None = None) -> dict:
+        now = _now()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "params": params,
+            "done": 0,
+            "total": total,
+            "result": None,
+            "error": None,
+            "retries": 0,
+            "owner_id": owner_id,
+            "created_at": now,
+            "updated_at": now,
+        }
+        # Run here unless this worker is busy; a queued job is left to whichever worker's poller gets to it first.
+        local = not self.store.shared or self._has_room()
+        if not local:
+            await self.store.insert(job)
+        else:
+            job = self.store.claimed(job)
+            self.reserved += 1
+            try:
+                await self.store.insert(job)
+            finally:
+                self.reserved -= 1
+            self._spawn(job)
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self.store.get(job_id)
+
+    def _has_room(self) -> bool:
+        return len(self.tasks) + self.reserved < self.concurrency
+
+    def _spawn(self, job: dict):
+        job_id = job["id"]
+        task = asyncio.create_task(self._run(job))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        async with self.semaphore:
+            try:
+                job["status"] = "running"
+                self.running[job_id] = job
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except ClaimLost:
+                logger.warning("Job %s was claimed by another worker, stopping here", job_id)
+            except Exception:
+                # Only the store itself failing ends up here; a shared job is resumed once its claim lapses.
+                logger.exception("Job %s could not be run", job_id)
+            finally:
+                self.running.pop(job_id, None)
+
+    async def _execute(self, job: dict):
+        handler = HANDLERS[job["kind"]]
+        attempt = 1
+        while True:
+            try:
+                finished = await self._step(handler, job)
+            except ClaimLost:
+                raise
+            except Exception as exc:
+                if attempt >= JOBS_MAX_ATTEMPTS or not _retryable(exc):
+                    logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+                    job.update(status="failed", error=_describe(exc), updated_at=_now())
+                    self.failed += 1
+                    await self.store.save(job)
+                    return
+                logger.warning("Job %s (%s) step failed, retrying: %s", job["id"], job["kind"], exc)
+                job["retries"] += 1
+                self.retries += 1
+                await asyncio.sleep(JOBS_RETRY_SECONDS * 2 ** (attempt - 1))
+                attempt += 1
+                continue
+            attempt = 1
+            if finished:
+                job["status"] = "succeeded"
+                self.succeeded += 1
+            job["updated_at"] = _now()
+            await self.store.save(job)
+            if finished:
+                return
+
+    async def _step(self, handler, job: dict) -> bool:
+        if not self.store.shared:
+            return await handler(job, self.store)
+        # The claim is renewed while the step runs, so a step held up on a lock is not mistaken for a dead worker's.
+        step = asyncio.create_task(handler(job, self.store))
+        try:
+            while True:
+                done, _ = await asyncio.wait({step}, timeout=JOBS_LEASE_SECONDS / 3)
+                if done:
+                    return step.result()
+                try:
+                    renewed = await self.store.renew(job)
+                except Exception as exc:
+                    logger.warning("Could not renew the claim on job %s: %s", job["id"], exc)
+                    continue
+                if not renewed:
+                    raise ClaimLost()
+        finally:
+            if not step.done():
+                step.cancel()
+                await asyncio.gather(step, return_exceptions=True)
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.store.prune()
+                while self._has_room():
+                    job = await self.store.claim_next(exclude=list(self.tasks))
+                    if job is None:
+                        break
+                    self._spawn(job)
+            except Exception:
+                logger.exception("Polling for jobs failed")
+            await asyncio.sleep(JOBS_POLL_SECONDS)
+
+    def start(self):
+        if self.store.shared and self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        interrupted = list(self.running.values())
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.release(interrupted)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.store.backend,
+            "concurrency": self.concurrency,
+            "active": len(self.tasks),
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+
+def create_store(workers: int):
+    backend = JOBS_BACKEND
+    if backend == "auto":
+        backend = "database" if workers > 1 else "memory"
+    if backend == "memory" and workers > 1:
+        logger.warning("JOBS_BACKEND=memory with %d workers: each job is only visible to the worker that accepted it", workers)
+    return DatabaseStore() if backend == "database" else MemoryStore()
+
+
+def configure(workers: int):
+    # Called by serve.py once it knows how many workers it will fork.
+    if JOBS_BACKEND == "memory" and workers > 1:
+        raise SystemExit(f"JOBS_BACKEND=memory cannot be shared by {workers} workers; use database or auto")
+    runner.store = create_store(workers)
+
+
+# Until serve.py configures it, WEB_CONCURRENCY (which uvicorn --workers also defaults to) is the worker count.
+runner = Runner(create_store(int(os.getenv("WEB_CONCURRENCY") or "1")))
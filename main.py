@@ -1,58 +1,188 @@
-from typing import List
+import os
+from contextlib import asynccontextmanager
+from typing import List, Literal
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, WebSocket, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.future import select
 
 import auth
+import capture
 import models
 import schemas
 import crud
+import events
+import export
+import jobs
+import metrics
+import pagination
+import ratelimit
+import response_cache
+import singleflight
+from responses import FastJSONResponse
 from models import Base
-from database import async_engine, AsyncSessionLocal
+import database
 
 
-app = FastAPI(
-    title="Task Tracker API",
-    version="1.0.0"
-)
+# "auto" creates missing tables unless Alembic manages the schema (an alembic_version table exists),
+# "true" always runs create_all and "false" never issues DDL at startup.
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "auto").lower()
 
 
 async def init_db():
-    async with async_engine.begin() as conn:
+    if DB_CREATE_SCHEMA == "false":
+        return
+    async with database.async_engine.begin() as conn:
+        if DB_CREATE_SCHEMA == "auto" and await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("alembic_version")):
+            return
         await conn.run_sync(Base.metadata.create_all)
 
 
-@app.on_event("startup")
-async def startup():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     await init_db()
+    jobs.runner.start()
+    metrics.startup.ready()
+    yield
+    await jobs.runner.stop()
+    await events.hub.stop()
+    auth.password_pool.shutdown()
+    await database.dispose_engines()
+
+
+app = FastAPI(
+    title="Task Tracker API",
+    version="1.0.0",
+    lifespan=lifespan
+)
+# Lets endpoints marked with @response_cache.cached serve from the response cache and coalesce identical reads.
+app.router.route_class = response_cache.CachedRoute
+if ratelimit.backend is not None:
+    app.add_middleware(ratelimit.RateLimitMiddleware, router=app.router)
+app.add_middleware(metrics.MetricsMiddleware)
+if capture.CAPTURE_PATH:
+    app.add_middleware(capture.CaptureMiddleware)
+database.on_engine_created(metrics.instrument_engine)
+
 
 
 # OAuth2PasswordBearer token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For routes open to anyone, where only some requests (e.g. background jobs) need to know the caller.
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
+async def get_db(request: Request):
+    async with database.AsyncSessionLocal() as session:
         yield session
+        if session.info.get("wrote") and database.replica_router.replicas:
+            database.mark_write(auth.client_key(request.headers, request.client))
+
+
+@asynccontextmanager
+async def read_session(request: Request):
+    if not database.reads_from_primary(auth.client_key(request.headers, request.client)):
+        for replica in database.replica_router.candidates():
+            session = replica.session_factory()
+            try:
+                # Check out the connection up front so an unreachable replica falls through to the next one.
+                await session.connection()
+            except (OSError, DBAPIError):
+                await session.close()
+                database.replica_router.mark_down(replica)
+                continue
+            try:
+                yield session
+            finally:
+                await session.close()
+            return
+
+    async with database.AsyncSessionLocal() as session:
+        yield session
+
+
+async def get_read_db(request: Request):
+    async with read_session(request) as session:
+        yield session
+
+
+def password_pool_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent password checks, retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+
+def export_tasks(request: Request, filename: str, format: str, **filters) -> StreamingResponse:
+    # The request's own session is closed before the body streams, so the export opens its own.
+    async def chunks():
+        async with read_session(request) as db:
+            async for rows in crud.stream_tasks(db, **filters):
+                yield rows
+
+    media_type, extension = export.FORMATS[format]
+    fields = [column.name for column in crud.TASK_COLUMNS]
+    return StreamingResponse(
+        export.encode(fields, chunks(), format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
+
+
+def job_accepted(job: dict) -> FastJSONResponse:
+    return FastJSONResponse(jobs.public(job), status_code=status.HTTP_202_ACCEPTED, headers={"Location": f"/jobs/{job['id']}"})
+
+
+def decode_cursor(cursor: str, order_by: str):
+    try:
+        return pagination.decode_cursor(cursor, order_by)
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def load_principal(payload: dict, db: AsyncSession) -> schemas.Principal:
+    username = payload.get("sub")
+    principal = auth.principal_cache.get(username)
+    if principal is None:
+        result = await db.execute(select(models.User).filter(models.User.username == username))
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        principal = schemas.Principal.model_validate(user)
+        auth.principal_cache.set(username, principal, ttl=auth.token_ttl(payload))
+    return principal
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.Principal:
+    payload = auth.decode_access_token(token)
+    if not payload:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    if auth.TRUST_TOKEN_CLAIMS and "uid" in payload:
+        return schemas.Principal(id=payload["uid"], username=payload["sub"])
+    return await load_principal(payload, db)
+
+
+async def get_optional_user(token: str | None = Depends(optional_oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.Principal | None:
+    if token is None:
+        return None
+    return await get_current_user(token, db)
 
 
 # PROTECTED ROUTE (Requires JWT)
 @app.get("/users/me/", response_model=schemas.UserResponse, tags=["Users"])
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def read_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     payload = auth.decode_access_token(token)
     if not payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    username = payload.get("sub")
-    result = await db.execute(select(models.User).filter(models.User.username == username))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    return user
+    # Token claims carry no profile fields, so this route always goes through the cache.
+    return await load_principal(payload, db)
 
 
 # REGISTER USER
@@ -62,17 +192,23 @@ async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db))
     existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already taken")
-    return await crud.create_user(db, user)
+    try:
+        return await crud.create_user(db, user)
+    except auth.PasswordPoolBusy:
+        raise password_pool_busy()
 
 
 # LOGIN (Generate JWT Token)
 @app.post("/token", response_model=schemas.Token, tags=["Users"])
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
-    user = await crud.authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await crud.authenticate_user(db, form_data.username, form_data.password)
+    except auth.PasswordPoolBusy:
+        raise password_pool_busy()
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    access_token = auth.create_access_token(data={"sub": user.username})
+    access_token = auth.create_access_token(data={"sub": user.username, "uid": user.id})
     refresh_token = auth.create_refresh_token(data={"sub": user.username})
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -90,7 +226,7 @@ async def refresh_token(refresh_token: str, db: AsyncSession = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    new_access_token = auth.create_access_token(data={"sub": user.username})
+    new_access_token = auth.create_access_token(data={"sub": user.username, "uid": user.id})
     new_refresh_token = auth.create_refresh_token(data={"sub": user.username})
     return {"access_token": new_access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
 
@@ -98,27 +234,103 @@ async def refresh_token(refresh_token: str, db: AsyncSession = Depends(get_db)):
 # PROJECT ROUTES
 # Create Project (Authenticated User Only)
 @app.post("/projects/", response_model=schemas.ProjectResponse, tags=["Projects"])
-async def create_project(project: schemas.ProjectCreate, user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def create_project(project: schemas.ProjectCreate, user: schemas.Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     return await crud.create_project(db, project, user.id)
 
 
-@app.get("/projects/", response_model=list[schemas.ProjectResponse], tags=["Projects"])
-async def get_projects(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
-    return await crud.get_projects(db, skip=skip, limit=limit)
+@app.get("/projects/", response_model=list[schemas.ProjectResponse] | schemas.ProjectPage, tags=["Projects"])
+async def get_projects(
+        skip: int = Query(0, ge=0),
+        limit: int = Query(10, ge=1, le=crud.MAX_PAGE_SIZE),
+        cursor: str = None,
+        order_by: Literal["id", "name"] = "id",
+        include: Literal["tasks"] = None,
+        tasks_limit: int = Query(20, ge=1, le=crud.MAX_EMBEDDED_TASKS),
+        db: AsyncSession = Depends(get_read_db)
+):
+    include_tasks = include == "tasks"
+    # Passing `cursor` (empty for the first page) switches to keyset pagination.
+    if cursor is None:
+        return FastJSONResponse(await crud.get_projects(db, skip=skip, limit=limit, include_tasks=include_tasks, tasks_limit=tasks_limit))
+    items, next_cursor = await crud.get_projects_page(
+        db,
+        cursor=decode_cursor(cursor, order_by),
+        limit=limit,
+        order_by=order_by,
+        include_tasks=include_tasks,
+        tasks_limit=tasks_limit
+    )
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
 
 
 @app.get("/projects/{project_id}", response_model=schemas.ProjectResponse, tags=["Projects"])
-async def get_project(project_id: int, db: AsyncSession = Depends(get_db)):
-    project = await crud.get_project(db, project_id)
+@response_cache.cached("project:{project_id}")
+async def get_project(
+        project_id: int,
+        include: Literal["tasks"] = None,
+        tasks_limit: int = Query(20, ge=1, le=crud.MAX_EMBEDDED_TASKS),
+        db: AsyncSession = Depends(get_read_db)
+):
+    project = await crud.get_project(db, project_id, include_tasks=include == "tasks", tasks_limit=tasks_limit)
     if project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return project
 
 
-@app.delete("/projects/{project_id}", tags=["Projects"])
-async def delete_project(project_id: int, db: AsyncSession = Depends(get_db)):
-    project = await crud.delete_project(db, project_id)
-    if project is None:
+@app.get("/projects/{project_id}/tasks/export", tags=["Projects"])
+async def export_project_tasks(
+        project_id: int,
+        request: Request,
+        format: Literal["ndjson", "csv"] = "ndjson",
+        db: AsyncSession = Depends(get_read_db)
+):
+    if not await crud.project_exists(db, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return export_tasks(request, f"project-{project_id}-tasks", format, project_id=project_id)
+
+
+@app.get("/projects/{project_id}/events", tags=["Projects"])
+async def project_events(project_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Server-sent events for the project's tasks: ready, task.created, task.updated, task.deleted,
+    # project.deleted, and resync when the client missed events and should reload.
+    if not await crud.project_exists(db, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return StreamingResponse(
+        events.sse_stream(project_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/projects/{project_id}/events/ws")
+async def project_events_websocket(websocket: WebSocket, project_id: int):
+    # The same events as /projects/{project_id}/events, one JSON text message each.
+    async with read_session(websocket) as db:
+        exists = await crud.project_exists(db, project_id)
+    if not exists:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await events.websocket_stream(websocket, project_id)
+
+
+@app.delete("/projects/{project_id}", tags=["Projects"], responses={202: {"model": schemas.JobResponse}})
+async def delete_project(
+        project_id: int,
+        background: bool = False,
+        user: schemas.Principal | None = Depends(get_optional_user),
+        db: AsyncSession = Depends(get_db)
+):
+    if background:
+        # Answers 202 at once; the tasks are deleted in chunks and the project last, see GET /jobs/{id}, which
+        # only shows a job to the user who submitted it.
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        if not await crud.project_exists(db, project_id):
+            raise HTTPException(status_code=404, detail="Project not found")
+        return job_accepted(await jobs.runner.submit("delete_project", {"project_id": project_id}, owner_id=user.id))
+    deleted_id = await crud.delete_project(db, project_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return {"message": "Project deleted successfully"}
 
@@ -126,24 +338,101 @@ async def delete_project(project_id: int, db: AsyncSession = Depends(get_db)):
 # TASK ROUTES
 # Create Task (Authenticated User Only)
 @app.post("/tasks/", response_model=schemas.TaskResponse, tags=["Tasks"])
-async def create_task(task: schemas.TaskCreate, user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def create_task(task: schemas.TaskCreate, user: schemas.Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     return await crud.create_task(db, task, user.id)
 
 
-@app.get("/tasks/", response_model=list[schemas.TaskResponse], tags=["Tasks"])
+@app.get("/tasks/", response_model=list[schemas.TaskResponse] | schemas.TaskPage, tags=["Tasks"])
+@response_cache.cached("tasks")
 async def read_tasks(
         project_id: int = None,
         completed: bool = None,
         owner_id: int = None,
-        skip: int = 0,
-        limit: int = 10,
-        db: AsyncSession = Depends(get_db)
+        skip: int = Query(0, ge=0),
+        limit: int = Query(10, ge=1, le=crud.MAX_PAGE_SIZE),
+        cursor: str = None,
+        order_by: Literal["id", "title"] = "id",
+        db: AsyncSession = Depends(get_read_db)
+):
+    # Passing `cursor` (empty for the first page) switches to keyset pagination.
+    if cursor is None:
+        return FastJSONResponse(await crud.get_tasks(db, project_id=project_id, completed=completed, owner_id=owner_id, skip=skip, limit=limit))
+    items, next_cursor = await crud.get_tasks_page(
+        db,
+        project_id=project_id,
+        completed=completed,
+        owner_id=owner_id,
+        cursor=decode_cursor(cursor, order_by),
+        limit=limit,
+        order_by=order_by
+    )
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+# Declared before /tasks/{task_id} so "search" is not parsed as a task id.
+@app.get("/tasks/search", response_model=schemas.TaskPage, tags=["Tasks"])
+@response_cache.cached("tasks")
+async def search_tasks(
+        q: str = Query(min_length=1),
+        project_id: int = None,
+        completed: bool = None,
+        owner_id: int = None,
+        cursor: str = None,
+        limit: int = Query(10, ge=1, le=crud.MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_read_db)
 ):
-    return await crud.get_tasks(db, project_id=project_id, completed=completed, owner_id=owner_id, skip=skip, limit=limit)
+    items, next_cursor = await crud.search_tasks(
+        db,
+        q,
+        project_id=project_id,
+        completed=completed,
+        owner_id=owner_id,
+        cursor=decode_cursor(cursor, "rank"),
+        limit=limit
+    )
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+# BULK TASK ROUTES
+# Declared before /tasks/{task_id} so "bulk" is not parsed as a task id.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "10000"))
+# Imports run as a background job (?background=true) are written in chunks, so they may be larger.
+BULK_MAX_BACKGROUND_ITEMS = int(os.getenv("BULK_MAX_BACKGROUND_ITEMS", "100000"))
+
+
+def check_bulk_size(count: int, limit: int = BULK_MAX_ITEMS):
+    if count > limit:
+        raise HTTPException(status_code=413, detail=f"At most {limit} items per bulk request")
+
+
+@app.post("/tasks/bulk", response_model=schemas.TaskBulkCreateResponse, tags=["Tasks"], responses={202: {"model": schemas.JobResponse}})
+async def create_tasks_bulk(payload: schemas.TaskBulkCreate, background: bool = False, user: schemas.Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if background:
+        check_bulk_size(len(payload.tasks), BULK_MAX_BACKGROUND_ITEMS)
+        tasks = [task.model_dump() for task in payload.tasks]
+        return job_accepted(await jobs.runner.submit("import_tasks", {"tasks": tasks}, owner_id=user.id, total=len(tasks)))
+    check_bulk_size(len(payload.tasks))
+    created, errors = await crud.create_tasks(db, payload.tasks, user.id)
+    return {"created": created, "errors": errors}
+
+
+@app.patch("/tasks/bulk", response_model=schemas.TaskBulkUpdateResponse, tags=["Tasks"])
+async def update_tasks_bulk(payload: schemas.TaskBulkUpdate, db: AsyncSession = Depends(get_db)):
+    check_bulk_size(len(payload.ids))
+    updated, errors = await crud.update_tasks(db, payload)
+    return {"updated": updated, "errors": errors}
+
+
+@app.delete("/tasks/bulk", response_model=schemas.TaskBulkDeleteResponse, tags=["Tasks"])
+async def delete_tasks_bulk(payload: schemas.TaskBulkDelete, db: AsyncSession = Depends(get_db)):
+    check_bulk_size(len(payload.ids))
+    deleted, errors = await crud.delete_tasks(db, payload.ids)
+    return {"deleted": deleted, "errors": errors}
 
 
 @app.get("/tasks/{task_id}", response_model=schemas.TaskResponse, tags=["Tasks"])
-async def read_task(task_id: int, db: AsyncSession = Depends(get_db)):
+@response_cache.cached("task:{task_id}", "project-deletes")
+async def read_task(task_id: int, db: AsyncSession = Depends(get_read_db)):
     task = await crud.get_task(db, task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -158,43 +447,190 @@ async def update_task(task_id: int, task: schemas.TaskBase, db: AsyncSession = D
     return updated_task
 
 
+@app.patch("/tasks/{task_id}", response_model=schemas.TaskResponse, tags=["Tasks"])
+async def patch_task(task_id: int, task: schemas.TaskUpdate, db: AsyncSession = Depends(get_db)):
+    updated_task = await crud.patch_task(db, task_id, task)
+    if updated_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return updated_task
+
+
 @app.delete("/tasks/{task_id}", tags=["Tasks"])
 async def delete_task(task_id: int, db: AsyncSession = Depends(get_db)):
-    deleted_task = await crud.delete_task(db, task_id)
-    if deleted_task is None:
+    deleted_id = await crud.delete_task(db, task_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return {"message": "Task deleted successfully"}
 
 
 # USER ROUTES
-@app.get("/users/{user_id}/projects", response_model=List[schemas.ProjectResponse])
-async def get_user_projects(user_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Project).options(selectinload(models.Project.tasks)).filter(models.Project.owner_id == user_id))
-    projects = result.scalars().all()
-    return projects
+@app.get("/users/{user_id}/projects", response_model=List[schemas.ProjectResponse] | schemas.ProjectPage)
+async def get_user_projects(
+        user_id: int,
+        cursor: str = None,
+        limit: int = Query(10, ge=1, le=crud.MAX_PAGE_SIZE),
+        order_by: Literal["id", "name"] = "id",
+        include: Literal["tasks"] = None,
+        tasks_limit: int = Query(20, ge=1, le=crud.MAX_EMBEDDED_TASKS),
+        db: AsyncSession = Depends(get_read_db)
+):
+    include_tasks = include == "tasks"
+    if cursor is not None:
+        items, next_cursor = await crud.get_projects_page(
+            db,
+            owner_id=user_id,
+            cursor=decode_cursor(cursor, order_by),
+            limit=limit,
+            order_by=order_by,
+            include_tasks=include_tasks,
+            tasks_limit=tasks_limit
+        )
+        return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+    return FastJSONResponse(await crud.get_projects(db, owner_id=user_id, limit=None, include_tasks=include_tasks, tasks_limit=tasks_limit))
+
+
+@app.get("/users/{user_id}/tasks", response_model=List[schemas.TaskResponse] | schemas.TaskPage)
+async def get_user_tasks(
+        user_id: int,
+        cursor: str = None,
+        limit: int = Query(10, ge=1, le=crud.MAX_PAGE_SIZE),
+        order_by: Literal["id", "title"] = "id",
+        db: AsyncSession = Depends(get_read_db)
+):
+    if cursor is not None:
+        items, next_cursor = await crud.get_tasks_page(
+            db,
+            owner_id=user_id,
+            cursor=decode_cursor(cursor, order_by),
+            limit=limit,
+            order_by=order_by
+        )
+        return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+    return FastJSONResponse(await crud.get_tasks(db, owner_id=user_id, limit=None))
+
+
+@app.get("/users/{user_id}/tasks/export")
+async def export_user_tasks(
+        user_id: int,
+        request: Request,
+        format: Literal["ndjson", "csv"] = "ndjson",
+        db: AsyncSession = Depends(get_read_db)
+):
+    if not await crud.user_exists(db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return export_tasks(request, f"user-{user_id}-tasks", format, owner_id=user_id)
+
+
+# STATS ROUTES
+@app.get("/stats", response_model=schemas.TaskStats, tags=["Stats"])
+@response_cache.cached("tasks")
+async def get_stats(group_by: Literal["project", "owner"] = None, db: AsyncSession = Depends(get_read_db)):
+    return FastJSONResponse(await crud.get_task_stats(db, group_by=group_by))
+
+
+@app.get("/stats/projects/{project_id}", response_model=schemas.TaskStats, tags=["Stats"])
+@response_cache.cached("project:{project_id}")
+async def get_project_stats(project_id: int, db: AsyncSession = Depends(get_read_db)):
+    if not await crud.project_exists(db, project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    return FastJSONResponse(await crud.get_task_stats(db, project_id=project_id, group_by="owner"))
+
+
+@app.get("/stats/users/{user_id}", response_model=schemas.TaskStats, tags=["Stats"])
+@response_cache.cached("tasks")
+async def get_user_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    return FastJSONResponse(await crud.get_task_stats(db, owner_id=user_id, group_by="project"))
+
+
+# SYNC ROUTES
+@app.get("/sync", response_model=schemas.SyncPage, tags=["Sync"])
+async def sync(
+        since: str = "",
+        project_id: int | None = None,
+        limit: int = Query(500, ge=1, le=crud.MAX_SYNC_CHANGES),
+        db: AsyncSession = Depends(get_read_db)
+):
+    # Pass `next` back as `since`: while has_more is true it continues the same window, after that it
+    # returns only what changed since. An empty `since` returns everything, for a first sync.
+    if db.get_bind().dialect.name != "postgresql":
+        raise HTTPException(status_code=501, detail="Sync requires PostgreSQL")
+    try:
+        token = pagination.decode_sync_token(since)
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse(await crud.get_changes(db, token, project_id=project_id, limit=limit))
+
 
+# JOB ROUTES
+@app.get("/jobs/{job_id}", response_model=schemas.JobResponse, tags=["Jobs"])
+async def read_job(job_id: str, user: schemas.Principal = Depends(get_current_user)):
+    job = await jobs.runner.get(job_id)
+    # Someone else's job is reported as missing, not forbidden, so ids cannot be probed.
+    if job is None or job["owner_id"] != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.public(job)
 
-@app.get("/users/{user_id}/tasks", response_model=List[schemas.TaskResponse])
-async def get_user_tasks(user_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Task).filter(models.Task.owner_id == user_id))
-    tasks = result.scalars().all()
-    return tasks
 
+# METRICS ROUTES
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    gauges = {
+        "db_pool": database.get_pool_status(),
+        "password_pool": auth.password_pool.stats(),
+        "principal_cache": auth.principal_cache.stats(),
+        "token_cache": auth.token_cache.stats(),
+        "response_cache": response_cache.get_stats(),
+        "startup": metrics.startup.stats(),
+        "events": events.hub.stats(),
+        "jobs": jobs.runner.stats(),
+        "rate_limit": ratelimit.get_stats(),
+        "singleflight": singleflight.group.stats(),
+    }
+    return Response(metrics.render(gauges), media_type=metrics.CONTENT_TYPE)
 
 
+@app.get("/metrics/passwords", tags=["Metrics"])
+async def password_pool_metrics():
+    return auth.password_pool.stats()
 
 
+@app.get("/metrics/principal-cache", tags=["Metrics"])
+async def principal_cache_metrics():
+    return auth.principal_cache.stats()
 
 
+@app.get("/metrics/token-cache", tags=["Metrics"])
+async def token_cache_metrics():
+    return auth.token_cache.stats()
 
 
+@app.get("/metrics/db-pool", tags=["Metrics"])
+async def db_pool_metrics():
+    return database.get_pool_status()
 
 
+@app.get("/metrics/events", tags=["Metrics"])
+async def events_metrics():
+    return events.hub.stats()
 
 
+@app.get("/metrics/jobs", tags=["Metrics"])
+async def jobs_metrics():
+    return jobs.runner.stats()
 
 
+@app.get("/metrics/rate-limit", tags=["Metrics"])
+async def rate_limit_metrics():
+    return ratelimit.get_stats()
 
 
+@app.get("/metrics/singleflight", tags=["Metrics"])
+async def singleflight_metrics():
+    return singleflight.group.stats()
 
 
+@app.get("/metrics/response-cache", tags=["Metrics"])
+async def response_cache_metrics():
+    return response_cache.get_stats()
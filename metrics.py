@@ -0,0 +1,194 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Adds X-DB-Queries and X-DB-Time-Ms to every response, for N+1 checks in tests and local debugging.
+DB_QUERIES_HEADER = os.getenv("DB_QUERIES_HEADER", "false").lower() == "true"
+LATENCY_BUCKETS = tuple(float(b) for b in os.getenv("LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(","))
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("task_tracker.slow_queries")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+
+
+@dataclass
+class RequestStats:
+    scope: dict
+    queries: int = 0
+    db_seconds: float = 0.0
+    slow_queries: int = 0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+def _process_age() -> float:
+    # Seconds since this process started (since the fork, for serve.py workers), so imports count too.
+    try:
+        with open("/proc/self/stat") as stat:
+            started_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError):
+        return time.perf_counter() - _imported_at
+
+
+_imported_at = time.perf_counter()
+
+
+class Startup:
+    """Cold start of this worker: process start to lifespan startup done, and to its first request."""
+
+    def __init__(self):
+        self.ready_seconds: float | None = None
+        self.first_request_seconds: float | None = None
+
+    def ready(self):
+        self.ready_seconds = _process_age()
+
+    def request_received(self):
+        if self.first_request_seconds is None:
+            self.first_request_seconds = _process_age()
+
+    def stats(self) -> dict:
+        return {"ready_seconds": self.ready_seconds, "first_request_seconds": self.first_request_seconds}
+
+
+startup = Startup()
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+# (method, route template, status) -> RouteMetrics. Templates, not raw paths, keep the label set bounded.
+routes: dict[tuple[str, str, int], RouteMetrics] = {}
+
+
+class MetricsMiddleware:
+    """Times each HTTP request and attributes the SQL it ran to its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        startup.request_received()
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_stats(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if DB_QUERIES_HEADER:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(stats.queries).encode()),
+                        (b"x-db-time-ms", f"{stats.db_seconds * 1000:.2f}".encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            metrics = routes.setdefault((scope["method"], stats.route, status_code), RouteMetrics())
+            metrics.latency.observe(time.perf_counter() - started)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_seconds
+            metrics.slow_queries += stats.slow_queries
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, so a statement that raises leaves nothing behind on the pooled connection.
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "-"
+        if stats is not None:
+            stats.slow_queries += 1
+        logger.warning("slow query %.1fms route=%s: %s", elapsed * 1000, route, " ".join(statement.split())[:500])
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _gauge_lines(prefix: str, values: dict) -> list[str]:
+    # Flattens the JSON stats the /metrics/* routes return; strings and lists are skipped.
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}".replace("-", "_")
+        if isinstance(value, dict):
+            lines += _gauge_lines(name, value)
+        elif isinstance(value, (bool, int, float)):
+            lines.append(f"{name} {float(value):g}")
+    return lines
+
+
+def render(gauges: dict[str, dict]) -> str:
+    # Samples of a metric family must be contiguous, so each family walks every route in turn.
+    by_route = [(f'method="{method}",route="{route}",status="{status_code}"', metrics) for (method, route, status_code), metrics in sorted(routes.items())]
+    lines = ["# TYPE http_request_duration_seconds histogram"]
+    for labels, metrics in by_route:
+        lines += metrics.latency.lines("http_request_duration_seconds", labels)
+    lines.append("# TYPE http_request_db_queries histogram")
+    for labels, metrics in by_route:
+        lines += metrics.queries.lines("http_request_db_queries", labels)
+    lines.append("# TYPE http_request_db_seconds_total counter")
+    lines += [f"http_request_db_seconds_total{{{labels}}} {metrics.db_seconds:.6f}" for labels, metrics in by_route]
+    lines.append("# TYPE http_request_slow_queries_total counter")
+    lines += [f"http_request_slow_queries_total{{{labels}}} {metrics.slow_queries}" for labels, metrics in by_route]
+    for section, values in gauges.items():
+        lines += _gauge_lines(f"task_tracker_{section}", values)
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import BigInteger, Column, DateTime, Integer, JSON, String, Boolean, DDL, ForeignKey, Index, event, func, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 
+from datetime import datetime
 from typing import Optional
 from typing import List
 
@@ -27,6 +28,9 @@ class User(Base):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        Index("ix_projects_owner_id_id", "owner_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(unique=True, index=True)
@@ -34,20 +38,144 @@ class Project(Base):
 
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
 
-    tasks: Mapped[List["Task"]] = relationship(back_populates="project", cascade="all, delete")
+    tasks: Mapped[List["Task"]] = relationship(back_populates="project", cascade="all, delete", passive_deletes=True)
     owner: Mapped["User"] = relationship(back_populates="projects")
 
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_project_id_completed_id", "project_id", "completed", "id"),
+        Index("ix_tasks_project_id_id", "project_id", "id"),
+        Index("ix_tasks_owner_id_id", "owner_id", "id"),
+        Index("ix_tasks_title_id", "title", "id"),
+        # Open tasks are the hot board query; crud filters with a literal `completed = false` so the predicate matches.
+        Index("ix_tasks_open_project_id_id", "project_id", "id", postgresql_where=text("completed = false")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(index=True)
     description: Mapped[str] = mapped_column(nullable=True)
     completed: Mapped[bool] = mapped_column(default=False)
 
-    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id"), nullable=False)
+    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
 
     project: Mapped["Project"] = relationship(back_populates="tasks")
     owner: Mapped["User"] = relationship(back_populates="tasks")
+
+
+# Full-text search column and index (same definition as migration f3b91d6e2c47). Left unmapped so task
+# reads and RETURNING never carry it; crud refers to it as tasks.search_vector. Config matches search.TS_CONFIG.
+TASK_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')"
+)
+event.listen(
+    Task.__table__,
+    "after_create",
+    DDL(f"ALTER TABLE tasks ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({TASK_SEARCH_VECTOR}) STORED").execute_if(dialect="postgresql")
+)
+event.listen(
+    Task.__table__,
+    "after_create",
+    DDL("CREATE INDEX ix_tasks_search_vector ON tasks USING gin (search_vector)").execute_if(dialect="postgresql")
+)
+
+
+class TaskStats(Base):
+    # Optional per (project, owner) task counts, kept in step by crud's task writes when TASK_STATS_SUMMARY is on.
+    __tablename__ = "task_stats"
+    __table_args__ = (
+        Index("ix_task_stats_owner_id", "owner_id"),
+    )
+
+    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    task_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    completed_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+
+class Job(Base):
+    # Background jobs, stored here on the jobs database backend so every worker sees them.
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    params: Mapped[dict] = mapped_column(JSON, nullable=False)
+    done: Mapped[int] = mapped_column(default=0, server_default="0")
+    total: Mapped[Optional[int]]
+    result: Mapped[Optional[dict]] = mapped_column(JSON)
+    error: Mapped[Optional[str]]
+    retries: Mapped[int] = mapped_column(default=0, server_default="0")
+    owner_id: Mapped[Optional[int]]
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # A running job whose claim has lapsed (its worker died) is picked up again by another worker.
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    # New on every claim; a worker only writes to the job while its token is still the current one.
+    claim_token: Mapped[Optional[str]] = mapped_column(String(32))
+
+
+class SyncTombstone(Base):
+    # One row per deleted task or project, so GET /sync can report deletions; written by a delete trigger.
+    __tablename__ = "sync_tombstones"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    entity: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    project_id: Mapped[int] = mapped_column(nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+# Change versions for GET /sync (same definitions as migration 9c5e7a1b3d20). Every insert and update stamps
+# the row's `version` with the id of the writing transaction, and every delete leaves a tombstone stamped the
+# same way; crud compares versions against transaction snapshots, so rows committing out of order are never
+# skipped. Left unmapped like search_vector; crud refers to them as <table>.version.
+CHANGE_VERSION = "pg_current_xact_id()::text::bigint"
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL(f"""
+        CREATE OR REPLACE FUNCTION stamp_change_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := {CHANGE_VERSION};
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql
+    """).execute_if(dialect="postgresql")
+)
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("""
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO sync_tombstones (entity, entity_id, project_id)
+            VALUES (TG_ARGV[0], OLD.id, coalesce((to_jsonb(OLD) ->> 'project_id')::integer, OLD.id));
+            RETURN OLD;
+        END $$ LANGUAGE plpgsql
+    """).execute_if(dialect="postgresql")
+)
+
+
+def _versioned(table, tombstone_entity: str | None = None):
+    statements = [
+        f"ALTER TABLE {table.name} ADD COLUMN version bigint NOT NULL DEFAULT ({CHANGE_VERSION})",
+        f"CREATE INDEX ix_{table.name}_version_id ON {table.name} (version, id)",
+    ]
+    if tombstone_entity is not None:
+        statements += [
+            f"CREATE TRIGGER {table.name}_stamp_version BEFORE UPDATE ON {table.name} FOR EACH ROW EXECUTE FUNCTION stamp_change_version()",
+            f"CREATE TRIGGER {table.name}_tombstone AFTER DELETE ON {table.name} FOR EACH ROW EXECUTE FUNCTION record_tombstone('{tombstone_entity}')",
+        ]
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+_versioned(Project.__table__, "project")
+_versioned(Task.__table__, "task")
+_versioned(SyncTombstone.__table__)
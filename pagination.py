@@ -0,0 +1,90 @@
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# The type of a cursor's key for each sort order it can be issued for; the key ends up in a SQL comparison.
+KEY_TYPES = {"id": int, "name": str, "title": str, "rank": (int, float)}
+# Ids are Postgres integers; a larger one would fail as a query parameter.
+MAX_ID = 2 ** 31 - 1
+
+
+@dataclass(frozen=True)
+class Cursor:
+    order_by: str
+    key: Any
+    id: int
+
+
+def encode_cursor(order_by: str, key: Any, id: int) -> str:
+    raw = json.dumps({"o": order_by, "k": key, "i": id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, order_by: str) -> Cursor | None:
+    # An empty token starts cursor mode from the first row.
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor = Cursor(order_by=data["o"], key=data["k"], id=int(data["i"]))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor.order_by != order_by:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    if isinstance(cursor.key, bool) or not isinstance(cursor.key, KEY_TYPES[order_by]) or not 0 <= cursor.id <= MAX_ID:
+        raise InvalidCursor("Malformed cursor")
+    return cursor
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    # A Postgres transaction snapshot: every transaction below xmin is finished, none from xmax on has
+    # started, and those listed in xip were still running.
+    xmin: int
+    xmax: int
+    xip: tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class SyncToken:
+    since: Snapshot | None
+    # Set while a window is being paged through: the snapshot it ends at and the last (version, source, id) sent.
+    until: Snapshot | None = None
+    after: tuple[int, int, int] | None = None
+
+
+def _snapshot(data) -> Snapshot:
+    xmin, xmax, xip = data
+    return Snapshot(int(xmin), int(xmax), tuple(int(xid) for xid in xip))
+
+
+def encode_sync_token(token: SyncToken) -> str:
+    data = {"s": token.since and [token.since.xmin, token.since.xmax, list(token.since.xip)]}
+    if token.until is not None:
+        data["u"] = [token.until.xmin, token.until.xmax, list(token.until.xip)]
+        data["a"] = list(token.after)
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> SyncToken:
+    # An empty token asks for everything, as a first sync.
+    if not token:
+        return SyncToken(since=None)
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        since = _snapshot(data["s"]) if data["s"] is not None else None
+        if "u" not in data:
+            return SyncToken(since=since)
+        version, source, id = data["a"]
+        return SyncToken(since=since, until=_snapshot(data["u"]), after=(int(version), int(source), int(id)))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed sync token")
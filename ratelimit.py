@@ -0,0 +1,235 @@
+import json
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+import auth
+from lru import TTLCache
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "off")  # memory, redis or off
+# The memory backend limits each worker separately; redis shares one set of buckets between them.
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "redis://localhost:6379/1")
+# Budgets are "N/S": N requests per S seconds per client, in bursts of up to N; "off" means unlimited.
+# The default covers every route without a budget of its own, as one bucket per client.
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "600/60")
+# Comma-separated "[METHOD ]route template=budget", each a bucket per client of its own.
+RATE_LIMIT_ROUTES = os.getenv("RATE_LIMIT_ROUTES", "POST /token=10/60,POST /register/=5/60,POST /refresh-token=30/60")
+RATE_LIMIT_EXEMPT_PATHS = tuple(path.strip() for path in os.getenv("RATE_LIMIT_EXEMPT_PATHS", "/metrics,/docs,/openapi.json").split(",") if path.strip())
+# Memory backend: buckets tracked per worker; a bucket left alone until full is forgotten.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+logger = logging.getLogger("task_tracker.ratelimit")
+
+
+@dataclass(frozen=True)
+class Budget:
+    name: str
+    capacity: float
+    # Tokens added per second.
+    rate: float
+
+    @property
+    def refill_seconds(self) -> float:
+        return self.capacity / self.rate
+
+
+def parse_budget(name: str, value: str) -> Budget | None:
+    value = value.strip().lower()
+    if value == "off":
+        return None
+    count, _, seconds = value.partition("/")
+    return Budget(name, float(count), float(count) / float(seconds or 1))
+
+
+def parse_routes(value: str) -> dict[str, Budget | None]:
+    budgets = {}
+    for item in value.split(","):
+        route, _, budget = item.rpartition("=")
+        if route.strip():
+            budgets[route.strip()] = parse_budget(route.strip(), budget)
+    return budgets
+
+
+class MemoryBackend:
+    """Token buckets in this process: (tokens, last refill) per key, updated in O(1) on each request."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        # An expired entry is a bucket that would have refilled by now, so forgetting it changes nothing.
+        self.buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def acquire(self, key: str, budget: Budget) -> float:
+        # Seconds until a request would be allowed: 0 if this one is.
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (budget.capacity, now))
+        tokens = min(budget.capacity, tokens + (now - updated) * budget.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / budget.rate
+        self.buckets.set(key, (tokens, now), ttl=budget.refill_seconds)
+        return wait
+
+    def stats(self) -> dict:
+        return {"keys": len(self.buckets)}
+
+
+# The same bucket as MemoryBackend, read and updated atomically with the Redis server's clock.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker, one hash per key, each request one script call."""
+
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str, budget: Budget) -> float:
+        wait = await self.script(keys=[f"rl:{key}"], args=[budget.capacity, budget.rate])
+        return float(wait.decode() if isinstance(wait, bytes) else wait)
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LocalRedis:
+    """In-process stand-in for the Redis calls made here, for tests and local runs; runs the bucket script in Python."""
+
+    def __init__(self):
+        self.backend = MemoryBackend(maxsize=RATE_LIMIT_MAX_KEYS, ttl=math.inf)
+
+    def register_script(self, script: str):
+        async def run(keys: list[str], args: list):
+            capacity, rate = float(args[0]), float(args[1])
+            return str(await self.backend.acquire(keys[0], Budget(keys[0], capacity, rate)))
+        return run
+
+
+class LimiterStats:
+    def __init__(self):
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+        # Budget name -> [allowed, limited]
+        self.by_budget: dict[str, list[int]] = {}
+
+    def record(self, budget: Budget, allowed: bool):
+        counts = self.by_budget.setdefault(budget.name, [0, 0])
+        if allowed:
+            self.allowed += 1
+            counts[0] += 1
+        else:
+            self.limited += 1
+            counts[1] += 1
+
+
+def _stat_name(name: str) -> str:
+    # "POST /token" -> "post_token", usable as part of a Prometheus metric name.
+    return re.sub(r"\W+", "_", name).strip("_").lower() or "root"
+
+
+def create_backend():
+    if RATE_LIMIT_BACKEND == "off":
+        return None
+    if RATE_LIMIT_BACKEND == "redis":
+        import redis.asyncio
+
+        return RedisBackend(redis.asyncio.from_url(RATE_LIMIT_URL))
+    refill_seconds = [budget.refill_seconds for budget in [default_budget, *route_budgets.values()] if budget is not None]
+    return MemoryBackend(RATE_LIMIT_MAX_KEYS, max(refill_seconds, default=60))
+
+
+default_budget = parse_budget("default", RATE_LIMIT_DEFAULT)
+route_budgets = parse_routes(RATE_LIMIT_ROUTES)
+backend = create_backend()
+stats = LimiterStats()
+
+
+def get_stats() -> dict:
+    return {
+        "allowed": stats.allowed,
+        "limited": stats.limited,
+        "errors": stats.errors,
+        "budgets": {_stat_name(name): {"allowed": allowed, "limited": limited} for name, (allowed, limited) in stats.by_budget.items()},
+        **(backend.stats() if backend is not None else {}),
+    }
+
+
+class RateLimitMiddleware:
+    """Answers 429 with Retry-After once a client has spent its budget, before the route (or bcrypt) runs."""
+
+    def __init__(self, app, router):
+        self.app = app
+        # The app's routes are added after the middleware, so they are looked up per request, not copied here.
+        self.router = router
+
+    def budget(self, scope) -> Budget | None:
+        if route_budgets:
+            for route in self.router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    # Lets MetricsMiddleware label a 429 with the route it was aimed at.
+                    scope["route"] = route
+                    for key in (f"{scope['method']} {route.path}", route.path):
+                        if key in route_budgets:
+                            return route_budgets[key]
+                    break
+        return default_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or backend is None or scope["path"].startswith(RATE_LIMIT_EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        budget = self.budget(scope)
+        if budget is None:
+            return await self.app(scope, receive, send)
+
+        client = auth.client_key(Headers(scope=scope), scope.get("client"))
+        try:
+            wait = await backend.acquire(f"{budget.name}:{client}", budget)
+        except Exception as exc:
+            # A limiter outage must not take the API down with it: let the request through.
+            stats.errors += 1
+            logger.warning("Rate limiter unavailable, allowing request: %s", exc)
+            return await self.app(scope, receive, send)
+
+        stats.record(budget, allowed=wait <= 0)
+        if wait <= 0:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Too many requests, retry shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
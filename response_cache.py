@@ -0,0 +1,297 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+import auth
+import database
+import singleflight
+from lru import TTLCache
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "auto")  # auto, memory, redis or off
+# "memory" only invalidates the worker that handled the write, so "auto" is memory for a single worker and off
+# for more (see configure); with several workers, use redis to cache.
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+# Also bounds staleness when a lagging replica repopulates an entry right after a write.
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+
+logger = logging.getLogger("task_tracker.response_cache")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    etag: str
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+
+class MemoryBackend:
+    """In-process LRU. Invalidation drops every entry indexed under a tag."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float, settle_seconds: float):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.keys_by_tag: dict[str, set[str]] = {}
+        self.epoch = 0
+        # Tag -> epoch of its last invalidation, kept long enough to outlive any in-flight request.
+        self.recently_invalidated = TTLCache(maxsize=maxsize, ttl=max(ttl, 60))
+        # Tags invalidated less than settle_seconds ago.
+        self.settling_tags = TTLCache(maxsize=maxsize, ttl=settle_seconds)
+
+    async def lookup(self, key: str, tags: list[str]):
+        return self.entries.get(key), self.epoch
+
+    async def store(self, key: str, tags: list[str], entry: CachedResponse, token):
+        # Skip the store if one of the tags was invalidated while the response was being built.
+        if any(self.recently_invalidated.get(tag, -1) > token for tag in tags):
+            return
+        self.entries.set(key, entry)
+        for tag in tags:
+            self.keys_by_tag.setdefault(tag, set()).add(key)
+        if sum(len(keys) for keys in self.keys_by_tag.values()) > 4 * self.entries.maxsize:
+            self._prune_index()
+
+    async def settling(self, tags: list[str]) -> bool:
+        return any(self.settling_tags.get(tag, False) for tag in tags)
+
+    async def invalidate(self, tags: list[str]):
+        self.epoch += 1
+        for tag in tags:
+            self.recently_invalidated.set(tag, self.epoch)
+            self.settling_tags.set(tag, True)
+            for key in self.keys_by_tag.pop(tag, ()):
+                self.entries.invalidate(key)
+
+    def _prune_index(self):
+        # Evicted and expired entries leave their keys behind in the tag index.
+        live = set(self.entries.keys())
+        self.keys_by_tag = {tag: keys & live for tag, keys in self.keys_by_tag.items() if keys & live}
+
+
+class RedisBackend:
+    """Versioned keys: each tag has a counter and entries are stored under the versions they were built from."""
+
+    name = "redis"
+
+    def __init__(self, client, ttl: float, settle_seconds: float):
+        self.client = client
+        self.ttl = ttl
+        self.settle_seconds = settle_seconds
+
+    async def _versions(self, tags: list[str]) -> list[str]:
+        if not tags:
+            return []
+        values = await self.client.mget([f"rc:tag:{tag}" for tag in tags])
+        return [value.decode() if isinstance(value, bytes) else str(value or 0) for value in values]
+
+    @staticmethod
+    def _entry_key(key: str, versions: list[str]) -> str:
+        return f"rc:entry:{key}:{'.'.join(versions)}"
+
+    async def lookup(self, key: str, tags: list[str]):
+        versions = await self._versions(tags)
+        raw = await self.client.get(self._entry_key(key, versions))
+        if raw is None:
+            return None, versions
+        data = json.loads(raw)
+        return CachedResponse(data["body"].encode(), data["media_type"], data["etag"]), versions
+
+    async def store(self, key: str, tags: list[str], entry: CachedResponse, token):
+        # Stored under the versions read before the DB query, so a racing invalidation orphans it.
+        raw = json.dumps({"body": entry.body.decode(), "media_type": entry.media_type, "etag": entry.etag})
+        await self.client.set(self._entry_key(key, token), raw, ex=max(1, int(self.ttl)))
+
+    async def settling(self, tags: list[str]) -> bool:
+        if not tags:
+            return False
+        return any(value is not None for value in await self.client.mget([f"rc:settling:{tag}" for tag in tags]))
+
+    async def invalidate(self, tags: list[str]):
+        for tag in tags:
+            await self.client.incr(f"rc:tag:{tag}")
+            if self.settle_seconds > 0:
+                await self.client.set(f"rc:settling:{tag}", 1, ex=math.ceil(self.settle_seconds))
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of the Redis API used here, for tests and local runs."""
+
+    def __init__(self):
+        self.data: dict[str, tuple[object, float | None]] = {}
+
+    def _get(self, name: str):
+        value, expires_at = self.data.get(name, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(name, None)
+            return None
+        return value
+
+    async def get(self, name: str):
+        return self._get(name)
+
+    async def mget(self, names: list[str]):
+        return [self._get(name) for name in names]
+
+    async def set(self, name: str, value, ex: int | None = None):
+        self.data[name] = (value, time.monotonic() + ex if ex else None)
+
+    async def incr(self, name: str) -> int:
+        value = int(self._get(name) or 0) + 1
+        self.data[name] = (value, None)
+        return value
+
+
+def create_backend(workers: int):
+    name = RESPONSE_CACHE_BACKEND
+    if name == "auto":
+        name = "memory" if workers <= 1 else "off"
+    if name == "off":
+        return None
+    if name == "redis":
+        import redis.asyncio
+
+        return RedisBackend(redis.asyncio.from_url(RESPONSE_CACHE_URL), RESPONSE_CACHE_TTL_SECONDS, database.READ_YOUR_WRITES_SECONDS)
+    if workers > 1:
+        logger.warning("RESPONSE_CACHE_BACKEND=memory with %d workers: the others serve stale entries after a write", workers)
+    return MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, database.READ_YOUR_WRITES_SECONDS)
+
+
+def configure(workers: int):
+    # Called by serve.py once it knows how many workers it will fork.
+    global backend
+    if RESPONSE_CACHE_BACKEND == "memory" and workers > 1:
+        raise SystemExit(f"RESPONSE_CACHE_BACKEND=memory cannot be invalidated across {workers} workers; use redis, auto or off")
+    backend = create_backend(workers)
+
+
+# Until serve.py configures it, WEB_CONCURRENCY (which uvicorn --workers also defaults to) is the worker count.
+backend = create_backend(int(os.getenv("WEB_CONCURRENCY") or "1"))
+stats = CacheStats()
+# Bumped on every invalidation in this worker; requests never join a single flight started before one.
+generation = 0
+
+
+def cached(*tags: str):
+    # Marks a GET endpoint as cacheable, and concurrent identical requests to it as safe to share one run;
+    # tags are formatted with the request's path parameters.
+    def decorator(endpoint):
+        endpoint.cache_tags = tags
+        return endpoint
+    return decorator
+
+
+async def invalidate(*tags: str):
+    global generation
+    if tags:
+        generation += 1
+    if backend is not None and tags:
+        stats.invalidations += 1
+        await backend.invalidate(list(dict.fromkeys(tags)))
+
+
+def reads_from_primary(request: Request) -> bool:
+    # Replicas only: without them every read is from the primary and the cache is invalidated by every write.
+    return bool(database.replica_router.replicas) and database.reads_from_primary(auth.client_key(request.headers, request.client))
+
+
+def cache_key(path: str, request: Request) -> str:
+    params = sorted(request.path_params.items()) + sorted(request.query_params.multi_items())
+    return hashlib.sha1(f"{path}?{params}".encode()).hexdigest()
+
+
+def _copy(response: Response) -> Response:
+    # Coalesced requests each get their own Response, so headers set on one never show up on another.
+    copy = Response(content=response.body, status_code=response.status_code)
+    copy.raw_headers = list(response.raw_headers)
+    return copy
+
+
+async def coalesce(key: tuple, build):
+    if not singleflight.SINGLEFLIGHT_ENABLED:
+        return await build()
+    return await singleflight.group.do((key, generation), build)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and etag in [value.strip() for value in if_none_match.split(",")]
+
+
+class CachedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        tag_templates = getattr(self.endpoint, "cache_tags", None)
+        if tag_templates is None:
+            return handler
+        path = self.path
+
+        async def build(request: Request, key: str, tags: list[str], token, primary: bool):
+            # Runs once per single flight: the endpoint, then the cache store.
+            response = await handler(request)
+            if backend is None or response.status_code != 200 or not hasattr(response, "body"):
+                return response, None
+
+            etag = f'"{hashlib.sha1(response.body).hexdigest()}"'
+            # A replica read right after a write may predate it: only cached once the write has had
+            # READ_YOUR_WRITES_SECONDS to replicate, or the lag would be served until the entry expires.
+            if not primary and not (database.replica_router.replicas and await backend.settling(tags)):
+                await backend.store(key, tags, CachedResponse(response.body, response.media_type, etag), token)
+            return response, etag
+
+        async def cached_handler(request: Request) -> Response:
+            key = cache_key(path, request)
+            tags, token = [], None
+            # A client that just wrote reads from the primary; the cache may hold what a lagging replica returned.
+            primary = reads_from_primary(request)
+            if backend is not None and not primary:
+                tags = [tag.format(**request.path_params) for tag in tag_templates]
+                entry, token = await backend.lookup(key, tags)
+                if entry is not None:
+                    stats.hits += 1
+                    if etag_matches(request, entry.etag):
+                        stats.not_modified += 1
+                        return Response(status_code=304, headers={"ETag": entry.etag})
+                    return Response(content=entry.body, media_type=entry.media_type, headers={"ETag": entry.etag})
+                stats.misses += 1
+
+            # Requests share a run only when they read from the same side: one that must see its own write never
+            # joins a flight reading from a replica.
+            response, etag = await coalesce((key, primary), lambda: build(request, key, tags, token, primary))
+            if not hasattr(response, "body"):
+                return response
+            if etag is not None and etag_matches(request, etag):
+                stats.not_modified += 1
+                return Response(status_code=304, headers={"ETag": etag})
+            response = _copy(response)
+            if etag is not None:
+                response.headers["ETag"] = etag
+            return response
+
+        return cached_handler
+
+
+def get_stats() -> dict:
+    return {
+        "backend": backend.name if backend is not None else "off",
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "not_modified": stats.not_modified,
+        "invalidations": stats.invalidations,
+    }
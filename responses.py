@@ -0,0 +1,15 @@
+import pydantic_core
+from starlette.responses import Response
+
+
+class FastJSONResponse(Response):
+    """Serializes plain dicts and lists straight to JSON bytes with pydantic-core's Rust encoder.
+
+    Returning one from a route skips FastAPI's response_model validation, so the content must
+    already have the response model's shape (rows selected column by column from crud).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return pydantic_core.to_json(content)
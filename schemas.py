@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import List
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, EmailStr
+from typing import List, Literal
 
 
 # Task Schemas
@@ -18,8 +19,97 @@ class TaskResponse(TaskBase):
     project_id: int
     owner_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TaskUpdate(BaseModel):
+    title: str | None = None
+    description: str | None = None
+    completed: bool | None = None
+
+
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate]
+
+
+class TaskBulkUpdate(TaskUpdate):
+    ids: List[int]
+
+
+class TaskBulkDelete(BaseModel):
+    ids: List[int]
+
+
+class BulkItemError(BaseModel):
+    index: int
+    id: int | None = None
+    detail: str
+
+
+class TaskBulkCreateResponse(BaseModel):
+    created: List[TaskResponse]
+    errors: List[BulkItemError] = []
+
+
+class TaskBulkUpdateResponse(BaseModel):
+    updated: List[TaskResponse]
+    errors: List[BulkItemError] = []
+
+
+class TaskBulkDeleteResponse(BaseModel):
+    deleted: List[int]
+    errors: List[BulkItemError] = []
+
+
+class TaskPage(BaseModel):
+    items: List[TaskResponse]
+    next_cursor: str | None = None
+
+
+class TaskCounts(BaseModel):
+    total: int
+    completed: int
+    open: int
+
+
+class TaskStatsGroup(TaskCounts):
+    project_id: int | None = None
+    owner_id: int | None = None
+
+
+class TaskStats(TaskCounts):
+    groups: List[TaskStatsGroup] = []
+
+
+# Sync Schemas
+class SyncChange(BaseModel):
+    type: Literal["task", "project"]
+    id: int
+    version: int
+    deleted: bool
+    # The row as GET /tasks/{id} or GET /projects/{id} would return it (without counts); null for deletions.
+    data: dict | None = None
+
+
+class SyncPage(BaseModel):
+    changes: List[SyncChange]
+    next: str
+    has_more: bool
+
+
+# Job Schemas
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    # Rows processed so far, out of `total` once known.
+    done: int
+    total: int | None = None
+    result: dict | None = None
+    error: str | None = None
+    retries: int
+    created_at: datetime
+    updated_at: datetime
 
 
 # Project Schemas
@@ -35,10 +125,16 @@ class ProjectCreate(ProjectBase):
 class ProjectResponse(ProjectBase):
     id: int
     owner_id: int
-    tasks: List[TaskResponse] = []
+    task_count: int = 0
+    completed_count: int = 0
+    tasks: List[TaskResponse] | None = None
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+
+class ProjectPage(BaseModel):
+    items: List[ProjectResponse]
+    next_cursor: str | None = None
 
 
 # User Schemas
@@ -55,8 +151,16 @@ class UserResponse(BaseModel):
     email: EmailStr
     full_name: str
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class Principal(BaseModel):
+    id: int
+    username: str
+    email: str | None = None
+    full_name: str | None = None
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Token(BaseModel):
@@ -0,0 +1,72 @@
+"""Compare access-token verifications per second across the decode paths.
+
+    python -m scripts.bench_jwt --seconds 2
+
+Measures a plain python-jose decode with the raw secret (the old path), a decode with a
+preloaded key object, and auth.decode_access_token with its verified-token cache, for
+HS256 and for asymmetric algorithms using throwaway in-memory keys.
+"""
+import argparse
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+
+import auth
+
+
+def generate_pem_pair(algorithm: str) -> tuple[str, str]:
+    if algorithm.startswith("ES"):
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+
+def rate(fn, seconds: float) -> float:
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn()
+        calls += 100
+    return calls / seconds
+
+
+def bench(algorithm: str, seconds: float):
+    if algorithm.startswith("HS"):
+        signing_material = verifying_material = "benchmark-secret"
+    else:
+        signing_material, verifying_material = generate_pem_pair(algorithm)
+    signing_key = jwk.construct(signing_material, algorithm)
+    verifying_key = jwk.construct(verifying_material, algorithm)
+    token = jwt.encode({"sub": "bench", "uid": 1, "exp": int(time.time()) + 3600}, signing_key, algorithm=algorithm)
+
+    # Point the app at this algorithm so the cached path is measured end to end.
+    auth.ALGORITHM, auth.ACCESS_VERIFYING_KEY = algorithm, verifying_key
+    auth.token_cache.clear()
+
+    results = {
+        "raw key": rate(lambda: jwt.decode(token, verifying_material, algorithms=[algorithm]), seconds),
+        "preloaded key": rate(lambda: jwt.decode(token, verifying_key, algorithms=[algorithm]), seconds),
+        "cached": rate(lambda: auth.decode_access_token(token), seconds),
+    }
+    baseline = results["raw key"]
+    for name, per_second in results.items():
+        print(f"{algorithm:6} {name:14} {per_second:12,.0f} verifications/s  x{per_second / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--algorithms", nargs="+", default=["HS256", "ES256", "RS256"])
+    args = parser.parse_args()
+    for algorithm in args.algorithms:
+        bench(algorithm, args.seconds)
@@ -0,0 +1,65 @@
+"""Fail when `import main` gets slower than a budget or pulls in modules that should load lazily.
+
+    python -m scripts.check_import_time --budget-ms 1000
+
+Runs `python -X importtime -c "import main"` --runs times in fresh interpreters, takes the fastest
+cumulative time of `main` (the least noisy figure) and lists the heaviest modules main imports
+directly. It also fails if any --forbid module shows up at all: python-jose, passlib and the asyncpg
+driver load on first use (auth.py, database.py), so their presence means a regression regardless
+of machine speed. The app's settings come from the environment, as for the server.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+DEFAULT_FORBIDDEN = ["jose", "passlib", "asyncpg"]
+
+
+def measure(module: str) -> dict[str, tuple[int, int]]:
+    # name -> (cumulative microseconds, nesting depth); depth 1 is imported from the -c statement.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for match in LINE.finditer(result.stderr):
+        modules[match.group(4)] = (int(match.group(2)), (len(match.group(3)) - 1) // 2 + 1)
+    return modules
+
+
+def main(args) -> int:
+    runs = [measure(args.module) for _ in range(args.runs)]
+    fastest = min(runs, key=lambda modules: modules[args.module][0])
+    total_ms = fastest[args.module][0] / 1000
+
+    children = sorted(((cumulative, name) for name, (cumulative, depth) in fastest.items() if depth == 2), reverse=True)
+    print(f"import {args.module}: {total_ms:.1f}ms (fastest of {args.runs}), budget {args.budget_ms:g}ms")
+    for cumulative, name in children[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    failed = False
+    loaded = sorted({name.split(".")[0] for name in fastest} & set(args.forbid))
+    if loaded:
+        print(f"FAIL: imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.1f}ms is over the {args.budget_ms:g}ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "1000")))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="heaviest direct imports to list")
+    parser.add_argument("--forbid", nargs="*", default=DEFAULT_FORBIDDEN, help="top-level packages that must not be imported")
+    sys.exit(main(parser.parse_args()))
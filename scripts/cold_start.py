@@ -0,0 +1,77 @@
+"""Measure cold start of serve.py: process launch to the first successful response.
+
+    python -m scripts.cold_start --runs 5 --workers 1 --workers 4
+
+Each run starts a fresh `python serve.py` on a free port, polls GET /metrics until it answers 200,
+then reads the answering worker's own task_tracker_startup_* gauges (fork to lifespan done, fork to
+first request) before shutting the server down. The database settings come from the environment.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def startup_gauges(body: str) -> dict:
+    gauges = {}
+    for line in body.splitlines():
+        if line.startswith("task_tracker_startup_"):
+            name, value = line.split()
+            gauges[name.removeprefix("task_tracker_startup_")] = float(value)
+    return gauges
+
+
+def run(workers: int, timeout: float) -> dict:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"serve.py exited with status {process.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"no response within {timeout}s")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as response:
+                    body = response.read().decode()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        first_response = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+    return {"first_response_seconds": first_response, **startup_gauges(body)}
+
+
+def main(args):
+    print(f"{'workers':>7} {'run':>4} {'first response s':>17} {'worker ready s':>15} {'worker first req s':>19}")
+    for workers in args.workers or [1]:
+        results = [run(workers, args.timeout) for _ in range(args.runs)]
+        for index, result in enumerate(results, 1):
+            print(f"{workers:7} {index:4} {result['first_response_seconds']:17.3f} {result.get('ready_seconds', 0):15.3f} "
+                  f"{result.get('first_request_seconds', 0):19.3f}")
+        print(f"{workers:7} {'med':>4} {statistics.median(r['first_response_seconds'] for r in results):17.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, action="append", help="worker count to measure; repeat to compare several")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    main(parser.parse_args())
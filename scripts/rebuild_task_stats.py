@@ -0,0 +1,21 @@
+"""Recompute the task_stats summary table from the tasks table.
+
+    python -m scripts.rebuild_task_stats
+
+Run it when turning TASK_STATS_SUMMARY on for a database whose tasks were written with it off.
+Writes to tasks are blocked for the duration.
+"""
+import asyncio
+
+import crud
+import database
+
+
+async def main():
+    async with database.AsyncSessionLocal() as db:
+        await crud.rebuild_task_stats(db)
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+import bisect
+import re
+
+from sqlalchemy import select
+
+import models
+
+# Text search configuration of tasks.search_vector; "simple" keeps words as typed, so prefixes match literally.
+TS_CONFIG = "simple"
+TITLE_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+WORD = re.compile(r"\w+")
+
+
+def words(text: str | None) -> list[str]:
+    return WORD.findall((text or "").lower())
+
+
+def tsquery(q: str) -> str | None:
+    # Every word must match, each as a prefix. Words are \w+ only, so nothing in q can inject tsquery syntax.
+    terms = words(q)
+    return " & ".join(f"{term}:*" for term in terms) if terms else None
+
+
+class InvertedIndex:
+    """In-process term -> {task id: weight} index, the search fallback for databases without tsvector (SQLite).
+
+    Loaded from the tasks table on first use and then kept current by crud's task writes, so it only
+    sees writes made through this process.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.postings: dict[str, dict[int, float]] = {}
+        self.terms_by_task: dict[int, list[str]] = {}
+        self._sorted_terms: list[str] | None = None
+
+    async def load(self, db):
+        self.reset()
+        result = await db.execute(select(models.Task.id, models.Task.title, models.Task.description))
+        for task_id, title, description in result.tuples():
+            self.add(task_id, title, description)
+        self.loaded = True
+
+    def reset(self):
+        self.loaded = False
+        self.postings.clear()
+        self.terms_by_task.clear()
+        self._sorted_terms = None
+
+    def add(self, task_id: int, title: str | None, description: str | None):
+        self.remove(task_id)
+        weights: dict[str, float] = {}
+        for term in words(title):
+            weights[term] = weights.get(term, 0.0) + TITLE_WEIGHT
+        for term in words(description):
+            weights[term] = weights.get(term, 0.0) + DESCRIPTION_WEIGHT
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self._sorted_terms = None
+            self.postings.setdefault(term, {})[task_id] = weight
+        self.terms_by_task[task_id] = list(weights)
+
+    def remove(self, task_id: int):
+        for term in self.terms_by_task.pop(task_id, ()):
+            postings = self.postings[term]
+            postings.pop(task_id, None)
+            if not postings:
+                del self.postings[term]
+                self._sorted_terms = None
+
+    def _terms_with_prefix(self, prefix: str):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, q: str) -> dict[int, float]:
+        # Task id -> score, for tasks where every query word prefixes some indexed term.
+        scores = None
+        for prefix in words(q):
+            matches: dict[int, float] = {}
+            for term in self._terms_with_prefix(prefix):
+                for task_id, weight in self.postings[term].items():
+                    matches[task_id] = matches.get(task_id, 0.0) + weight
+            if scores is None:
+                scores = matches
+            else:
+                scores = {task_id: score + matches[task_id] for task_id, score in scores.items() if task_id in matches}
+        return scores or {}
+
+
+fallback_index = InvertedIndex()
+
+
+def index_tasks(tasks):
+    if fallback_index.loaded:
+        for task in tasks:
+            fallback_index.add(task["id"], task["title"], task["description"])
+
+
+def unindex_tasks(task_ids):
+    if fallback_index.loaded:
+        for task_id in task_ids:
+            fallback_index.remove(task_id)
@@ -0,0 +1,137 @@
+"""Production entry point: uvicorn workers preforked from one parent, one per CPU by default.
+
+    python serve.py                                # WEB_CONCURRENCY workers, else one per usable CPU
+    python serve.py --workers 4 --port 8080
+
+The parent imports the app once, prepares the schema (see DB_CREATE_SCHEMA in main.py), loads the
+crypto modules auth defers and binds the socket, then forks the workers, which share all of that
+and never run DDL themselves. Dead workers are replaced; SIGTERM or SIGINT shuts every worker down
+gracefully. Each worker has its own connection pool, so size POSTGRES_POOL_SIZE +
+POSTGRES_MAX_OVERFLOW times the worker count to fit the database's max_connections. With more than
+one worker, background jobs are kept in the database (see JOBS_BACKEND in jobs.py) and the in-process
+response cache is off (see RESPONSE_CACHE_BACKEND in response_cache.py).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+logger = logging.getLogger("task_tracker.serve")
+
+
+def default_workers() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    # Affinity respects cpusets (containers, taskset); cpu_count() reports every CPU on the host.
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+async def prepare(app_module):
+    await app_module.init_db()
+    # Close the parent's connections before forking; workers open their own.
+    await app_module.database.dispose_engines()
+
+
+def run_worker(app, sock: socket.socket, args):
+    # The parent's signal handlers would otherwise be what uvicorn restores and re-raises on exit.
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    code = 1
+    try:
+        config = uvicorn.Config(
+            app,
+            log_level=args.log_level,
+            proxy_headers=args.proxy_headers,
+            forwarded_allow_ips=args.forwarded_allow_ips,
+            timeout_graceful_shutdown=args.graceful_timeout,
+        )
+        uvicorn.Server(config).run(sockets=[sock])
+        code = 0
+    finally:
+        os._exit(code)
+
+
+def main(args):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(args.log_level.upper())
+    import main as app_module
+
+    count = args.workers or default_workers()
+    app_module.jobs.configure(count)
+    app_module.response_cache.configure(count)
+    asyncio.run(prepare(app_module))
+    app_module.auth.preload()
+    app_module.DB_CREATE_SCHEMA = "false"
+    sock = bind(args.host, args.port, args.backlog)
+
+    workers: dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app_module.app, sock, args)
+        workers[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Starting %d workers on %s:%d", count, args.host, args.port)
+    for _ in range(count):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning("Worker %d exited with status %d, replacing it", pid, os.waitstatus_to_exitcode(status))
+        # A worker that dies straight after starting would otherwise be respawned in a tight loop.
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        if not stopping:
+            spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, help="defaults to WEB_CONCURRENCY, else one per usable CPU")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--proxy-headers", action="store_true", help="trust X-Forwarded-* from --forwarded-allow-ips")
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    main(parser.parse_args())
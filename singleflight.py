@@ -0,0 +1,60 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable
+
+# Concurrent identical reads in a worker share one run of the endpoint (see response_cache.CachedRoute).
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+
+class Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class Group:
+    """Runs one call per key at a time; callers arriving while it runs wait for its result instead."""
+
+    def __init__(self):
+        self.flights: dict[Hashable, Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self.flights.get(key)
+        if flight is None:
+            # Its own task, so a caller that disconnects does not cancel the work under the others still waiting.
+            flight = Flight(asyncio.create_task(fn()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Everyone gave up on it: stop the query rather than finish it for nobody.
+                flight.task.cancel()
+                self.abandoned += 1
+                self._land(key, flight)
+
+    def _land(self, key: Hashable, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SINGLEFLIGHT_ENABLED,
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+group = Group()